@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+"""
+Benchmark of the per-class conversion plans (clean_objects) against the
+original clean_object path, on a large list of bills and detailed bills.
+
+Usage:
+    PYTHONPATH=. python benchmarks/clean_object.py [NUMBER_OF_OBJECTS]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from weboob.capabilities.bill import Bill, Detail
+
+from cozyweboob.capabilities.base import (clean_object, clean_objects,
+                                          get_plan)
+from cozyweboob.tools.jsonwriter import json_dump
+
+
+BASE_URL = "https://example.com"
+
+
+def build_objects(count):
+    """
+    Build a mix of bills and detailed bills.
+
+    Args:
+        count: Number of objects to build.
+    Returns: A list of Weboob objects.
+    """
+    objects = []
+    for i in range(count):
+        if i % 2:
+            obj = Bill(id=u"bill-%d" % i, url=u"/bills/%d.pdf" % i)
+            obj.date = date(2016, 1 + i % 12, 1)
+            obj.duedate = date(2016, 1 + i % 12, 15)
+            obj.format = u"pdf"
+            obj.label = u"Bill %d" % i
+            obj.type = u"bill"
+            obj.price = Decimal("42.%02d" % (i % 100))
+            obj.currency = u"EUR"
+        else:
+            obj = Detail(id=u"detail-%d" % i)
+            obj.label = u"Call to 0612345678"
+            obj.datetime = datetime(2016, 1 + i % 12, 1, 12, i % 60)
+            obj.price = Decimal("0.%02d" % (i % 100))
+            obj.currency = u"EUR"
+            obj.quantity = Decimal(i % 300)
+            obj.unit = u"s"
+        obj.backend = "benchmark"
+        objects.append(obj)
+    return objects
+
+
+def legacy_path(objects):
+    """
+    Original conversion path, one clean_object call per object.
+    """
+    return json_dump([clean_object(obj, base_url=BASE_URL)
+                      for obj in objects])
+
+
+def plan_path(objects):
+    """
+    Batch conversion path, using per-class conversion plans.
+    """
+    return json_dump(clean_objects(objects, base_url=BASE_URL))
+
+
+def main():
+    """
+    Main function
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    objects = build_objects(count)
+    # The benchmarked classes should use the planned conversion
+    for cls in (Bill, Detail):
+        assert not get_plan(cls).generic, (
+            "%s falls back to generic conversion." % cls.__name__
+        )
+    # Both paths should give the very same JSON output
+    assert legacy_path(objects) == plan_path(objects)
+    for name, function in (("clean_object", legacy_path),
+                           ("clean_objects", plan_path)):
+        best = min(timeit.repeat(lambda: function(objects),
+                                 number=1, repeat=5))
+        print("%-14s %8.1f ms  (%.2f us/object)" % (
+            name, best * 1000, best * 1e6 / count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Coordinator sharding konnectors runs across multiple cozyweboob nodes.
+
+Batches of konnectors are split into per-konnector work items, pushed to a
+shared work queue and run by worker nodes (see WorkerNode). The coordinator
+then gathers back the results of the batch.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import os
+import time
+
+from cozyweboob.__main__ import BREAKERS
+from cozyweboob.tools.circuit_breaker import CircuitOpenError
+from cozyweboob.tools.workqueue import get_work_queue
+
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+
+class BatchTimeoutError(Exception):
+    """
+    Raised when no worker node ran a konnector in time.
+    """
+    pass
+
+
+class Coordinator(object):
+    """
+    Dispatch konnectors to worker nodes, exposing a main_fetch compatible
+    interface.
+    """
+    def __init__(self, work_queue=None, poll_interval=0.5, timeout=None):
+        """
+        Args:
+            work_queue: The WorkQueue shared with the worker nodes. Defaults
+                to the one described by the COZYWEBOOB_QUEUE URL.
+            poll_interval: Time between two checks of the batch results, in
+                seconds.
+            timeout: Maximum time to wait for a batch to complete, in seconds.
+                Defaults to COZYWEBOOB_QUEUE_TIMEOUT, or no timeout.
+        """
+        if work_queue is None:
+            work_queue = get_work_queue(os.environ["COZYWEBOOB_QUEUE"])
+        if timeout is None and os.environ.get("COZYWEBOOB_QUEUE_TIMEOUT"):
+            timeout = float(os.environ["COZYWEBOOB_QUEUE_TIMEOUT"])
+        self.work_queue = work_queue
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def main_fetch(self, used_modules):
+        """
+        Fetch konnectors on the worker nodes. Circuit breakers are checked
+        before dispatching konnectors, so that they reflect the runs of the
+        whole cluster.
+
+        Args:
+            used_modules: A list of modules description dicts.
+        Returns: A dict of all the results, ready to be JSON serialized.
+        """
+        fetched_data = collections.defaultdict(dict)
+        allowed_modules = []
+        for module in used_modules:
+            try:
+                BREAKERS.check(module)
+            except CircuitOpenError as exception:
+                logger.error("Skipping module %s: %s", module["id"], exception)
+                fetched_data[module["id"]]["error"] = exception
+                continue
+            allowed_modules.append(module)
+        if not allowed_modules:
+            return fetched_data
+        try:
+            fetched_data.update(self.run_batch(allowed_modules))
+        finally:
+            # Make sure every run is recorded, to release half-open breakers
+            for module in allowed_modules:
+                BREAKERS.record(module, fetched_data.get(module["id"], {
+                    "error": BatchTimeoutError("Batch was interrupted.")
+                }))
+        return fetched_data
+
+    def run_batch(self, used_modules):
+        """
+        Run a batch of konnectors on the worker nodes and gather their
+        results.
+
+        Args:
+            used_modules: A list of modules description dicts.
+        Returns: A dict of all the results, ready to be JSON serialized.
+        """
+        batch_id = self.work_queue.submit(used_modules)
+        logger.info("Submitted batch %s of %d konnectors.",
+                    batch_id, len(used_modules))
+        start = time.time()
+        try:
+            # Only count done items while waiting, results are decoded once
+            while True:
+                done, total = self.work_queue.batch_progress(batch_id)
+                if done >= total:
+                    break
+                if (
+                        self.timeout is not None and
+                        time.time() - start > self.timeout
+                ):
+                    logger.error("Batch %s timed out.", batch_id)
+                    break
+                time.sleep(self.poll_interval)
+            results = self.work_queue.batch_results(batch_id)
+        finally:
+            self.work_queue.delete_batch(batch_id)
+        fetched_data = collections.defaultdict(dict)
+        for module in used_modules:
+            if module["id"] not in results:
+                fetched_data[module["id"]]["error"] = BatchTimeoutError(
+                    "No worker node ran this konnector in time."
+                )
+        fetched_data.update(results)
+        return fetched_data
+
+    def status(self):
+        """
+        Get the status of the cluster.
+
+        Returns: A JSON-serializable dict with the live nodes.
+        """
+        return {"nodes": self.work_queue.live_nodes()}
+
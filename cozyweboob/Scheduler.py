@@ -0,0 +1,275 @@
+"""
+Scheduler to periodically run a set of konnectors.
+
+Each konnector is run every `interval` seconds. Runs are spread using some
+jitter, ordered by priority and by time since their last success, and capped
+by a global and a per-module concurrency limit. Results are persisted on disk
+and runs are skipped as long as a fresh result is available.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import os
+import random
+import threading
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:  # Python 2
+    from urllib import quote
+
+from cozyweboob.__main__ import fetch_konnectors, main_fetch
+from cozyweboob.tools.env import get_data_dir
+from cozyweboob.tools.storage import load_json, save_json
+
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+# Default interval between two runs of a konnector, in seconds
+DEFAULT_INTERVAL = 3600
+# Maximum time to sleep between two scheduling rounds, in seconds
+MAX_SLEEP = 60
+
+
+class ScheduledKonnector(object):
+    """
+    Scheduling state of a konnector.
+    """
+    def __init__(self, konnector, results_dir):
+        """
+        Args:
+            konnector: A konnector description dict, with optional `interval`
+                (in seconds) and `priority` (higher first) keys.
+            results_dir: Directory where results are persisted.
+        """
+        self.konnector = konnector
+        self.id = konnector["id"]
+        self.name = konnector["name"]
+        self.interval = konnector.get("interval", DEFAULT_INTERVAL)
+        self.priority = konnector.get("priority", 0)
+        self.result_path = os.path.join(
+            results_dir,
+            "%s.json" % quote(self.id, safe="")
+        )
+        self.running = False
+        self.next_run = 0
+        self.last_success = self.load_last_success()
+
+    def load_last_success(self):
+        """
+        Get the time of the last successful run from the persisted result.
+
+        Returns: A timestamp, or None if there is no successful run.
+        """
+        stored = load_json(self.result_path, {})
+        return stored.get("last_success")
+
+    def is_fresh(self, now):
+        """
+        Check whether a fresh result exists for this konnector. Persisted
+        results are checked as well, as they may have been written by another
+        process.
+
+        Args:
+            now: The current timestamp.
+        Returns: true / false
+        """
+        last_success = self.load_last_success()
+        if last_success is not None:
+            self.last_success = max(self.last_success or 0, last_success)
+        return (
+            self.last_success is not None and
+            now - self.last_success < self.interval
+        )
+
+    def store(self, result, now):
+        """
+        Persist the result of a run. The result of the last successful run is
+        kept when a run fails, along with the error of the failed run.
+
+        Args:
+            result: The results dict of this konnector.
+            now: The timestamp of the end of the run.
+        """
+        if "error" in result:
+            stored = load_json(self.result_path, {})
+            stored.update({
+                "id": self.id,
+                "last_run": now,
+                "error": result["error"]
+            })
+        else:
+            self.last_success = now
+            stored = {
+                "id": self.id,
+                "last_run": now,
+                "last_success": now,
+                "error": None,
+                "result": result
+            }
+        save_json(self.result_path, stored)
+
+
+class Scheduler(object):
+    """
+    Periodically run a set of konnectors.
+    """
+    def __init__(self, konnectors, fetcher=main_fetch, max_concurrency=4,
+                 max_module_concurrency=1, jitter=0.1, results_dir=None):
+        """
+        Args:
+            konnectors: A list of konnector description dicts.
+            fetcher: The function to use to fetch konnectors.
+            max_concurrency: Maximum number of concurrent runs.
+            max_module_concurrency: Maximum number of concurrent runs of a
+                given module.
+            jitter: Fraction of the interval to randomly spread runs.
+            results_dir: Directory where results are persisted.
+        """
+        if results_dir is None:
+            results_dir = get_data_dir("results")
+        self.fetcher = fetcher
+        self.max_concurrency = max_concurrency
+        self.max_module_concurrency = max_module_concurrency
+        self.jitter = jitter
+        self.entries = [
+            ScheduledKonnector(konnector, results_dir)
+            for konnector in konnectors
+        ]
+        self.running = collections.Counter()
+        self.condition = threading.Condition()
+        self.stopped = False
+        now = time.time()
+        for entry in self.entries:
+            if entry.is_fresh(now):
+                entry.next_run = self.next_fresh_run(entry)
+            else:
+                # Spread the first runs to avoid a thundering herd
+                entry.next_run = now + random.uniform(
+                    0, self.jitter * entry.interval
+                )
+
+    def next_run(self, entry, start):
+        """
+        Compute the next run time of a konnector.
+
+        Args:
+            entry: The ScheduledKonnector.
+            start: Timestamp to count the interval from.
+        Returns: The next run timestamp.
+        """
+        return start + entry.interval * (
+            1 + random.uniform(-self.jitter, self.jitter)
+        )
+
+    def next_fresh_run(self, entry):
+        """
+        Compute the next run time of a konnector with a fresh result, making
+        sure it is not before the result expires.
+
+        Args:
+            entry: The ScheduledKonnector.
+        Returns: The next run timestamp.
+        """
+        return max(self.next_run(entry, entry.last_success),
+                   entry.last_success + entry.interval)
+
+    def due_entries(self, now):
+        """
+        Get the konnectors due to run, by decreasing priority and increasing
+        last success time.
+
+        Args:
+            now: The current timestamp.
+        Returns: A sorted list of ScheduledKonnector.
+        """
+        due = [
+            entry for entry in self.entries
+            if not entry.running and entry.next_run <= now
+        ]
+        due.sort(key=lambda entry: (-entry.priority, entry.last_success or 0))
+        return due
+
+    def schedule(self, now):
+        """
+        Start the konnectors due to run, within the concurrency limits. Must
+        be called with the condition held.
+
+        Args:
+            now: The current timestamp.
+        Returns: The list of started ScheduledKonnector.
+        """
+        started = []
+        for entry in self.due_entries(now):
+            if sum(self.running.values()) >= self.max_concurrency:
+                break
+            if self.running[entry.name] >= self.max_module_concurrency:
+                continue
+            if entry.is_fresh(now):
+                logger.info("Skipping konnector %s, result is fresh.",
+                            entry.id)
+                entry.next_run = self.next_fresh_run(entry)
+                continue
+            entry.running = True
+            self.running[entry.name] += 1
+            thread = threading.Thread(target=self.run, args=(entry,))
+            thread.daemon = True
+            thread.start()
+            started.append(entry)
+        return started
+
+    def run(self, entry):
+        """
+        Run a konnector and persist its results.
+
+        Args:
+            entry: The ScheduledKonnector to run.
+        """
+        logger.info("Running konnector %s.", entry.id)
+        try:
+            result = fetch_konnectors(
+                [entry.konnector],
+                fetcher=self.fetcher
+            ).get(entry.id, {})
+        except Exception as exception:
+            result = {"error": exception}
+        now = time.time()
+        try:
+            entry.store(result, now)
+        except Exception as exception:
+            logger.error("Could not store results of konnector %s: %s.",
+                         entry.id, exception)
+        with self.condition:
+            entry.running = False
+            entry.next_run = self.next_run(entry, now)
+            self.running[entry.name] -= 1
+            self.condition.notify()
+
+    def run_forever(self):
+        """
+        Scheduling loop, until stop is called.
+        """
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+                self.schedule(now)
+                # Sleep until the next konnector is due, or a run ends
+                next_runs = [
+                    entry.next_run for entry in self.entries
+                    if not entry.running and entry.next_run > now
+                ]
+                timeout = MAX_SLEEP
+                if next_runs:
+                    timeout = min(min(next_runs) - now, MAX_SLEEP)
+                self.condition.wait(timeout)
+
+    def stop(self):
+        """
+        Stop the scheduling loop. Runs in progress are not interrupted.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import logging
+import os
 
 from weboob.core import Weboob
 from weboob.exceptions import ModuleInstallError
@@ -49,6 +50,7 @@ class WeboobProxy(object):
         # Get a weboob instance
         self.weboob = Weboob()
         self.backend = None
+        self._repositories_stamp = None
 
     def install_modules(self, capability=None, name=None):
         """
@@ -111,6 +113,53 @@ class WeboobProxy(object):
             ]
         }
 
+    def get_config_desc(self, modulename):
+        """
+        Get the configuration options of a module, installing it if required.
+
+        Args:
+            modulename: The name of the module.
+        Returns:
+            A tuple of the module version and a JSON-serializable dict of its
+            configuration options, or None if there is no such module.
+        """
+        installed_modules = self.install_modules(name=modulename)
+        if modulename not in installed_modules:
+            return None
+        # The module may have been updated since it was loaded
+        self.weboob.modules_loader.loaded.pop(modulename, None)
+        module = self.weboob.modules_loader.get_or_load_module(modulename)
+        return (
+            installed_modules[modulename]["version"],
+            weboob_tools.dictify_config_desc(module.config)
+        )
+
+    def get_module_version(self, modulename):
+        """
+        Get the version of a module from the local modules list, without
+        updating it. The modules list is reloaded if it was updated on disk
+        in the meantime (by another WeboobProxy for instance).
+
+        Args:
+            modulename: The name of the module.
+        Returns:
+            The module version, or None if there is no such module.
+        """
+        repositories = self.weboob.repositories
+        stamp = sorted(
+            (name, os.path.getmtime(os.path.join(repositories.repos_dir,
+                                                 name)))
+            for name in os.listdir(repositories.repos_dir)
+        )
+        if stamp != self._repositories_stamp:
+            if self._repositories_stamp is not None:
+                repositories.load()
+            self._repositories_stamp = stamp
+        infos = repositories.get_module_info(modulename)
+        if infos is None:
+            return None
+        return infos.version
+
     def init_backend(self, modulename, parameters):
         """
         Backend initialization.
@@ -0,0 +1,130 @@
+"""
+Worker node running konnectors dispatched by a Coordinator.
+
+Konnectors are assigned to nodes by consistent hashing of their ids, so that a
+given konnector keeps running on the same node, with warm sessions and
+backends caches. Nodes also pick up the items of nodes which stopped sending
+heartbeats.
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from cozyweboob.__main__ import main_fetch
+from cozyweboob.tools.jsonwriter import json_dump
+from cozyweboob.tools.workqueue import NODE_TIMEOUT, get_work_queue
+
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+# Number of attempts to store the results of an item
+COMPLETE_ATTEMPTS = 5
+
+
+class WorkerNode(object):
+    """
+    Run konnectors from a shared work queue.
+    """
+    def __init__(self, work_queue=None, name=None, fetcher=main_fetch,
+                 concurrency=1, poll_interval=1):
+        """
+        Args:
+            work_queue: The WorkQueue shared with the coordinator. Defaults
+                to the one described by the COZYWEBOOB_QUEUE URL.
+            name: The node name, must be stable across restarts to keep the
+                konnectors assignment. Defaults to COZYWEBOOB_NODE or the
+                host name.
+            fetcher: The function to use to fetch konnectors.
+            concurrency: Number of konnectors to run concurrently.
+            poll_interval: Time to wait when there is no item to run, in
+                seconds.
+        """
+        if work_queue is None:
+            work_queue = get_work_queue(os.environ["COZYWEBOOB_QUEUE"])
+        if name is None:
+            name = os.environ.get("COZYWEBOOB_NODE", socket.gethostname())
+        self.work_queue = work_queue
+        self.name = name
+        self.fetcher = fetcher
+        self.concurrency = max(concurrency, 1)
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run_item(self, item_id, konnector):
+        """
+        Run a work item and store its results. The item is requeued if its
+        results can't be stored.
+
+        Args:
+            item_id: The work item id.
+            konnector: The konnector description dict.
+        """
+        logger.info("Running konnector %s.", konnector.get("id"))
+        try:
+            result = json_dump(dict(self.fetcher([konnector])))
+        except Exception as exception:
+            result = json_dump({konnector.get("id"): {"error": exception}})
+        for attempt in range(COMPLETE_ATTEMPTS):
+            try:
+                self.work_queue.complete(item_id, result)
+                return
+            except Exception as exception:
+                logger.error("Could not store results of konnector %s: %s.",
+                             konnector.get("id"), exception)
+                time.sleep(2 ** attempt)
+        # Let another run of this node pick it up again
+        self.work_queue.release(self.name, item_id)
+
+    def consume(self):
+        """
+        Claim and run work items until stop is called.
+        """
+        while not self.stopped.is_set():
+            try:
+                item = self.work_queue.claim(self.name)
+            except Exception as exception:
+                logger.error("Could not claim a work item: %s.", exception)
+                item = None
+            if item is None:
+                self.stopped.wait(self.poll_interval)
+                continue
+            try:
+                self.run_item(*item)
+            except Exception as exception:
+                # Keep consuming, the item will be requeued on restart
+                logger.error("Could not run work item %s: %s.", item[0],
+                             exception)
+
+    def run_forever(self):
+        """
+        Heartbeat and consume loops, until stop is called.
+        """
+        # Items still marked as running by this node were interrupted by a
+        # previous run of the node, run them again
+        self.work_queue.release(self.name)
+        self.work_queue.heartbeat(self.name)
+        threads = [
+            threading.Thread(target=self.consume)
+            for _ in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        while not self.stopped.wait(NODE_TIMEOUT / 3.0):
+            try:
+                self.work_queue.heartbeat(self.name)
+            except Exception as exception:
+                logger.error("Could not send heartbeat: %s.", exception)
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        """
+        Stop the node. Runs in progress are completed first.
+        """
+        self.stopped.set()
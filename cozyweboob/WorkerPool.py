@@ -0,0 +1,356 @@
+"""
+Pool of pre-forked worker processes to run konnectors.
+
+Each worker process holds its own pre-warmed Weboob handle and fetches one
+konnector at a time. Workers are recycled after a given number of jobs or
+once their memory usage crosses a threshold, so that leaking modules and
+CPU-heavy parsing are contained in their own process.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from cozyweboob.WeboobProxy import WeboobProxy
+from cozyweboob.__main__ import BREAKERS, main_fetch
+from cozyweboob.tools.circuit_breaker import CircuitOpenError
+from cozyweboob.tools.env import get_int_env
+from cozyweboob.tools.process import get_rss
+
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+# Maximum time for a new worker to get ready, in seconds
+READY_TIMEOUT = 60
+# Maximum time to wait before spawning a worker again, in seconds
+MAX_SPAWN_DELAY = 60
+
+
+class WorkerCrashedError(Exception):
+    """
+    Raised when a worker process died while running a konnector.
+    """
+    pass
+
+
+def _send_result(conn, result, retire):
+    """
+    Send back a result to the pool, making sure its errors can be pickled and
+    unpickled.
+
+    Args:
+        conn: The worker end of the pipe.
+        result: The dict of results, as returned by main_fetch.
+        retire: Whether this worker is about to exit.
+    """
+    for module_result in result.values():
+        if "error" not in module_result:
+            continue
+        try:
+            pickle.loads(pickle.dumps(module_result["error"]))
+        except Exception:
+            # Some exceptions raised by modules cannot be pickled (or
+            # unpickled, typically when their constructor takes extra
+            # arguments), send back their string representation, which is
+            # what ends up in the JSON anyway.
+            module_result["error"] = repr(module_result["error"])
+    try:
+        conn.send((result, retire))
+    except (pickle.PicklingError, TypeError, AttributeError) as exception:
+        # Results are pickled before anything is written to the pipe
+        conn.send(({
+            module_id: {"error": repr(exception)} for module_id in result
+        }, retire))
+
+
+def _worker_loop(conn, max_jobs, max_rss):
+    """
+    Main loop of a worker process.
+
+    Args:
+        conn: The worker end of the pipe to the pool.
+        max_jobs: Number of konnectors to run before exiting.
+        max_rss: Memory threshold (in bytes) above which the worker exits.
+    """
+    # Pre-warm the Weboob core once for all the jobs of this worker
+    weboob_proxy = WeboobProxy()
+    conn.send("ready")
+    jobs = 0
+    while True:
+        try:
+            konnector = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if konnector is None:
+            # Stop sentinel
+            break
+        try:
+            # Circuit breakers are handled by the pool, which sees all the runs
+            result = dict(main_fetch([konnector], weboob_proxy=weboob_proxy,
+                                     breakers=None))
+        except Exception as exception:
+            # main_fetch reraises in debug mode, do not lose the worker
+            result = {konnector.get("id"): {"error": exception}}
+        jobs += 1
+        retire = (
+            (max_jobs > 0 and jobs >= max_jobs) or
+            (max_rss > 0 and get_rss() > max_rss)
+        )
+        _send_result(conn, result, retire)
+        if retire:
+            break
+    conn.close()
+
+
+class Worker(object):
+    """
+    Handle on a worker process, from the pool side.
+    """
+    def __init__(self, max_jobs, max_rss):
+        """
+        Spawn a new worker process.
+
+        Args:
+            max_jobs: Number of konnectors to run before recycling.
+            max_rss: Memory threshold (in bytes) before recycling.
+        """
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_loop,
+            args=(child_conn, max_jobs, max_rss)
+        )
+        self.process.daemon = True
+        self.process.start()
+        # Only the worker should hold its end of the pipe
+        child_conn.close()
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """
+        Wait for the worker process to be ready to run konnectors.
+
+        Args:
+            timeout: Maximum time to wait, in seconds.
+        Returns: true / false
+        """
+        try:
+            return self.conn.poll(timeout) and self.conn.recv() == "ready"
+        except (EOFError, IOError, OSError):
+            return False
+
+    def run(self, konnector):
+        """
+        Run a konnector in this worker.
+
+        Args:
+            konnector: A konnector description dict.
+        Returns:
+            A tuple of the results dict and whether the worker is exiting.
+        """
+        self.conn.send(konnector)
+        return self.conn.recv()
+
+    def stop(self):
+        """
+        Stop the worker process.
+        """
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            # Worker already gone
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerPool(object):
+    """
+    Pool of pre-forked workers, exposing a main_fetch compatible interface.
+    """
+    def __init__(self, size=None, max_jobs=None, max_rss=None):
+        """
+        Spawn the worker processes.
+
+        Args:
+            size: Number of worker processes. Defaults to
+                COZYWEBOOB_WORKERS or the number of CPUs.
+            max_jobs: Number of konnectors a worker runs before being
+                recycled. Defaults to COZYWEBOOB_WORKER_MAX_JOBS or 50.
+            max_rss: RSS threshold, in MB, above which a worker is recycled.
+                Defaults to COZYWEBOOB_WORKER_MAX_RSS or 512.
+        """
+        if size is None:
+            size = get_int_env("COZYWEBOOB_WORKERS",
+                               multiprocessing.cpu_count())
+        if max_jobs is None:
+            max_jobs = get_int_env("COZYWEBOOB_WORKER_MAX_JOBS", 50)
+        if max_rss is None:
+            max_rss = get_int_env("COZYWEBOOB_WORKER_MAX_RSS", 512)
+        self.size = max(size, 1)
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss * 1024 * 1024
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        # Retired workers, to be replaced by the spawner thread
+        self._retired = queue.Queue()
+        self._spawner = threading.Thread(target=self._respawn)
+        self._spawner.daemon = True
+        self._spawner.start()
+
+    def _spawn(self):
+        """
+        Spawn a new worker, waiting for it to be ready. Spawning is retried
+        until it succeeds.
+
+        Returns: The new Worker.
+        """
+        delay = 1
+        while True:
+            worker = Worker(self.max_jobs, self.max_rss)
+            if worker.wait_ready():
+                return worker
+            # The worker may have inherited a lock held by another thread
+            # when forked, and hang
+            logger.error("Worker %s did not get ready, spawning it again.",
+                         worker.process.pid)
+            worker.process.terminate()
+            worker.stop()
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_SPAWN_DELAY)
+
+    def _respawn(self):
+        """
+        Replace retired workers, until close is called. Workers are only
+        forked from this thread, so that requests do not wait for them.
+        """
+        while True:
+            worker = self._retired.get()
+            if worker is None:
+                return
+            logger.info("Recycling worker %s.", worker.process.pid)
+            worker.stop()
+            self._idle.put(self._spawn())
+
+    def run(self, konnector):
+        """
+        Run a single konnector on the first available worker.
+
+        Args:
+            konnector: A konnector description dict.
+        Returns: A dict of results, as returned by main_fetch.
+        """
+        try:
+            BREAKERS.check(konnector)
+        except CircuitOpenError as exception:
+            logger.error("Skipping konnector %s: %s", konnector.get("id"),
+                         exception)
+            return {konnector.get("id"): {"error": exception}}
+        # Make sure the run is recorded, to release half-open breakers
+        outcome = {
+            "error": WorkerCrashedError("Konnector run was interrupted.")
+        }
+        try:
+            result = self._run(konnector)
+            outcome = result.get(konnector.get("id"), {})
+            return result
+        finally:
+            BREAKERS.record(konnector, outcome)
+
+    def _run(self, konnector):
+        """
+        Run a single konnector on the first available worker, see run.
+
+        Args:
+            konnector: A konnector description dict.
+        Returns: A dict of results, as returned by main_fetch.
+        """
+        worker = self._idle.get()
+        try:
+            result, retire = worker.run(konnector)
+        except (EOFError, IOError, OSError):
+            logger.error("Worker crashed while running konnector %s.",
+                         konnector.get("id"))
+            worker.process.join(1)
+            result = {
+                konnector.get("id"): {
+                    "error": WorkerCrashedError(
+                        "Worker crashed with exit code %s." % (
+                            worker.process.exitcode,
+                        )
+                    )
+                }
+            }
+            retire = True
+        except Exception as exception:
+            # Do not lose the worker, its state is unknown though
+            logger.error("Could not get results of konnector %s: %s.",
+                         konnector.get("id"), exception)
+            result = {konnector.get("id"): {"error": exception}}
+            retire = True
+        if retire or not worker.process.is_alive():
+            self._retired.put(worker)
+        else:
+            self._idle.put(worker)
+        return result
+
+    def main_fetch(self, used_modules):
+        """
+        Fetch konnectors in parallel using the pool workers.
+
+        Args:
+            used_modules: A list of modules description dicts.
+        Returns: A dict of all the results, ready to be JSON serialized.
+        """
+        fetched_data = collections.defaultdict(dict)
+        pending = queue.Queue()
+        for module in used_modules:
+            pending.put(module)
+        lock = threading.Lock()
+
+        def consume():
+            """
+            Run pending konnectors until there is none left.
+            """
+            while True:
+                try:
+                    module = pending.get_nowait()
+                except queue.Empty:
+                    return
+                result = self.run(module)
+                with lock:
+                    for module_id, data in result.items():
+                        fetched_data[module_id].update(data)
+
+        threads = [
+            threading.Thread(target=consume)
+            for _ in range(min(self.size, len(used_modules)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return fetched_data
+
+    def close(self):
+        """
+        Stop all the worker processes.
+        """
+        self._retired.put(None)
+        self._spawner.join()
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
@@ -4,6 +4,11 @@ CozyWeboob main module
 from __future__ import absolute_import
 
 from cozyweboob.WeboobProxy import WeboobProxy
-from cozyweboob.__main__ import clean, main_fetch, main
+from cozyweboob.__main__ import clean, fetch_konnectors, main_fetch, main
+from cozyweboob.WorkerPool import WorkerPool
+from cozyweboob.Scheduler import Scheduler
+from cozyweboob.Coordinator import Coordinator
+from cozyweboob.WorkerNode import WorkerNode
 
-__all__ = ["WeboobProxy", "clean", "main_fetch", "main"]
+__all__ = ["WeboobProxy", "WorkerPool", "Scheduler", "Coordinator",
+           "WorkerNode", "clean", "fetch_konnectors", "main_fetch", "main"]
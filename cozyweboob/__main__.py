@@ -18,8 +18,11 @@ from getpass import getpass
 from requests.utils import dict_from_cookiejar
 
 from cozyweboob.WeboobProxy import WeboobProxy
+from cozyweboob.tools.circuit_breaker import (CircuitBreakerRegistry,
+                                              CircuitOpenError)
 from cozyweboob.tools.env import is_in_debug_mode
-from cozyweboob.tools.jsonwriter import pretty_json
+from cozyweboob.tools.jsonwriter import json_dump, pretty_json
+from cozyweboob.tools.validation import SchemaCache, ValidationError
 
 
 # Module specific logger
@@ -30,6 +33,12 @@ logger = logging.getLogger(__name__)
 CAPABILITIES_CONVERSION_MODULES = importlib.import_module(".capabilities",
                                                           package="cozyweboob")
 
+# Cache of the modules parameters schemas, to validate konnectors
+SCHEMAS = SchemaCache(WeboobProxy)
+
+# Circuit breakers of the modules, to skip failing websites
+BREAKERS = CircuitBreakerRegistry()
+
 
 def clean():
     """
@@ -53,23 +62,37 @@ def clean():
     }
 
 
-def main_fetch(used_modules):
+def main_fetch(used_modules, weboob_proxy=None, breakers=BREAKERS):
     """
     Main fetching code
 
     Args:
         used_modules: A list of modules description dicts.
+        weboob_proxy: An optional WeboobProxy to reuse for every module. A
+            fresh one is built for each module if not provided.
+        breakers: The CircuitBreakerRegistry to check modules against, or
+            None to always run them.
     Returns: A dict of all the results, ready to be JSON serialized.
     """
     # Fetch data for the specified modules
     fetched_data = collections.defaultdict(dict)
     logger.info("Start fetching from konnectors.")
     for module in used_modules:
+        if breakers is not None:
+            try:
+                breakers.check(module)
+            except CircuitOpenError as exception:
+                logger.error("Skipping module %s: %s", module["id"], exception)
+                fetched_data[module["id"]]["error"] = exception
+                continue
         try:
-            weboob_proxy = WeboobProxy()
+            if weboob_proxy is None:
+                module_proxy = WeboobProxy()
+            else:
+                module_proxy = weboob_proxy
             logger.info("Fetching data from module %s.", module["id"])
             # Get associated backend for this module
-            backend = weboob_proxy.init_backend(
+            backend = module_proxy.init_backend(
                 module["name"],
                 module["parameters"]
             )
@@ -118,19 +141,82 @@ def main_fetch(used_modules):
             if is_in_debug_mode():
                 # Reraise if in debug
                 raise
-            else:
-                # Skip any errored module when not in debug
-                continue
+        finally:
+            if breakers is not None:
+                breakers.record(module, fetched_data[module["id"]])
     logger.info("Done fetching from konnectors.")
     return fetched_data
 
 
-def main(json_params):
+def fetch_konnectors(konnectors, fetcher=main_fetch, index_base=0):
+    """
+    Validate konnectors descriptions and fetch the valid ones.
+
+    Invalid konnectors are rejected before building any backend, with an
+    "error" entry and a "validation_errors" entry associating invalid fields
+    to error messages. Konnectors without any id are identified by their
+    position, as "#N".
+
+    Args:
+        konnectors: A list of konnectors description dicts.
+        fetcher: The function to use to fetch the valid konnectors.
+        index_base: Position of the first konnector, to identify konnectors
+            without any id.
+    Returns: A dict of all the results, ready to be JSON serialized.
+    """
+    fetched_data = collections.defaultdict(dict)
+    valid_konnectors = []
+    for index, konnector in enumerate(konnectors):
+        try:
+            SCHEMAS.validate(konnector)
+        except ValidationError as exception:
+            logger.error("Invalid konnector description: %s", exception)
+            try:
+                konnector_id = konnector["id"]
+            except (KeyError, TypeError):
+                # Use the konnector position if it has no id
+                konnector_id = "#%d" % (index_base + index)
+            fetched_data[konnector_id]["error"] = exception
+            fetched_data[konnector_id]["validation_errors"] = (
+                exception.errors
+            )
+            continue
+        except Exception as exception:
+            # Could not get the schema, let the fetch handle the konnector
+            logger.info("Could not validate konnector %s: %s",
+                        konnector.get("id"), exception)
+        valid_konnectors.append(konnector)
+    if valid_konnectors:
+        for konnector_id, data in fetcher(valid_konnectors).items():
+            fetched_data[konnector_id].update(data)
+    return fetched_data
+
+
+def prompt_missing_parameters(konnectors):
+    """
+    Debug only: Handle missing passwords using getpass.
+
+    Args:
+        konnectors: A list of konnectors description dicts, updated in place.
+    """
+    for module in konnectors:
+        for param in module["parameters"]:
+            if not module["parameters"][param]:
+                module["parameters"][param] = getpass(
+                    "Password for module %s? " % (
+                        module["id"],
+                    )
+                )
+
+
+def main(json_params, fetcher=main_fetch):
     """
     Main code
 
     Args:
         json_params: A JSON string representing the params to use.
+        fetcher: The function to use to fetch the konnectors, defaults to
+            main_fetch. Typically a WorkerPool main_fetch method.
     Returns: A JSON string of the results.
     """
     try:
@@ -138,20 +224,46 @@ def main(json_params):
         konnectors = json.loads(json_params)
         # Debug only: Handle missing passwords using getpass
         if is_in_debug_mode():
-            for module in konnectors:
-                for param in module["parameters"]:
-                    if not module["parameters"][param]:
-                        module["parameters"][param] = getpass(
-                            "Password for module %s? " % (
-                                module["id"],
-                            )
-                        )
+            prompt_missing_parameters(konnectors)
     except ValueError:
         logger.error("Invalid JSON input.")
         sys.exit(-1)
 
     # Return the dict results
-    return main_fetch(konnectors)
+    return fetch_konnectors(konnectors, fetcher=fetcher)
+
+
+def main_ndjson(lines, output, fetcher=main_fetch):
+    """
+    Streaming main code, fetching konnectors as soon as they are read.
+
+    Each input line is a JSON konnector description, and the results of each
+    konnector are written as soon as it completes, as a single JSON line.
+    Invalid lines and konnectors without any id are identified by their line
+    number, as "#N".
+
+    Args:
+        lines: An iterable of input lines.
+        output: A file-like object to write the results to.
+        fetcher: The function to use to fetch the konnectors, see main.
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            konnector = json.loads(line)
+        except ValueError as exception:
+            logger.error("Invalid JSON input on line %d.", line_number)
+            result = {"#%d" % line_number: {"error": exception}}
+        else:
+            # Debug only: Handle missing passwords using getpass
+            if is_in_debug_mode() and isinstance(konnector, dict):
+                prompt_missing_parameters([konnector])
+            result = fetch_konnectors([konnector], fetcher=fetcher,
+                                      index_base=line_number)
+        output.write(json_dump(result) + "\n")
+        output.flush()
 
 
 if __name__ == '__main__':
@@ -162,6 +274,10 @@ if __name__ == '__main__':
                 format='%(levelname)s: %(message)s',
                 level=logging.INFO
             )
-        print(main(sys.stdin.read()))
+        if "--ndjson" in sys.argv[1:]:
+            # Read stdin line by line, iterating over it buffers on Python 2
+            main_ndjson(iter(sys.stdin.readline, ""), sys.stdout)
+        else:
+            print(pretty_json(main(sys.stdin.read())))
     except KeyboardInterrupt:
         pass
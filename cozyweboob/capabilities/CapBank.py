@@ -0,0 +1,312 @@
+"""
+This module contains all the conversion functions associated to the Bank
+capability.
+"""
+import datetime
+import itertools
+
+from cozyweboob.capabilities.base import clean_objects
+from cozyweboob.tools.columnar import columnize_sections
+from cozyweboob.tools.spill import DEFAULT_THRESHOLD, Spiller
+from weboob.capabilities.base import empty
+
+# Default number of transactions converted at once
+DEFAULT_BATCH_SIZE = 1000
+# Transactions are sometimes listed a few days late, keep looking for unseen
+# transactions this number of days before the newest known one
+OVERLAP_DAYS = 7
+
+
+def to_date(value):
+    """
+    Get the date part of a transaction date.
+
+    Args:
+        value: A date or datetime, possibly empty.
+    Returns: A date, or None.
+    """
+    if empty(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def parse_date(value):
+    """
+    Parse a date stored in a cursor.
+
+    Args:
+        value: An ISO formatted date string.
+    Returns: A date.
+    """
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def iter_batches(iterable, size):
+    """
+    Split an iterable in lists of bounded size.
+
+    Args:
+        iterable: The iterable to split.
+        size: The maximum size of a batch.
+    Returns: A generator of lists.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class TransactionCursors(object):
+    """
+    Per-account cursors on the transactions history.
+
+    A cursor stores the date of the newest known transaction of an account,
+    and the fingerprints of the known transactions within OVERLAP_DAYS of it.
+    Transactions are listed from the newest to the oldest by Weboob, so
+    listing can stop as soon as transactions get older than this overlap.
+
+    Cursors are not stored here, they are returned along with the
+    transactions and passed back by the client on its next run. This way,
+    they only move forward once the client actually got the transactions.
+    """
+    def __init__(self, cursors=None):
+        """
+        Args:
+            cursors: The cursors returned by a previous run, by account id.
+        """
+        if not isinstance(cursors, dict):
+            cursors = {}
+        self.cursors = dict(cursors)
+
+    def iter_new(self, account_id, transactions):
+        """
+        Filter the unseen transactions of an account, stopping early on the
+        already seen ones. The cursor of the account is updated once all the
+        unseen transactions have been consumed.
+
+        Args:
+            account_id: The account id.
+            transactions: An iterable of Transaction objects, newest first.
+        Returns: A generator of the unseen Transaction objects.
+        """
+        overlap = datetime.timedelta(days=OVERLAP_DAYS)
+        cursor = self.cursors.get(account_id)
+        stop_date = None
+        known = set()
+        if cursor is not None:
+            stop_date = parse_date(cursor["date"]) - overlap
+            known = set(cursor["fingerprints"])
+        # Fingerprints and dates of the recent transactions
+        recent = []
+        newest = None
+        seen = set()
+        for transaction in transactions:
+            date = to_date(transaction.date)
+            if stop_date is not None and date is not None and date < stop_date:
+                break
+            if empty(transaction.id) or not transaction.id:
+                fingerprint = transaction.unique_id(seen=seen)
+            else:
+                fingerprint = transaction.id
+            if date is not None:
+                newest = max(newest or date, date)
+                # Only the transactions in the overlap end up in the cursor
+                if date >= newest - overlap:
+                    recent.append((date, fingerprint))
+            if fingerprint in known:
+                continue
+            yield transaction
+        self.update(account_id, recent, cursor)
+
+    def update(self, account_id, recent, cursor):
+        """
+        Update the cursor of an account.
+
+        Args:
+            account_id: The account id.
+            recent: A list of tuples of the date and fingerprint of the
+                transactions listed during this run.
+            cursor: The previous cursor of this account, or None.
+        """
+        if not recent:
+            return
+        newest = max(date for date, _ in recent)
+        if cursor is not None:
+            newest = max(newest, parse_date(cursor["date"]))
+        start = newest - datetime.timedelta(days=OVERLAP_DAYS)
+        self.cursors[account_id] = {
+            "date": newest.isoformat(),
+            "fingerprints": sorted(set(
+                fingerprint for date, fingerprint in recent if date >= start
+            ))
+        }
+
+
+def fetch_accounts(bank):
+    """
+    Fetch the list of accounts
+
+    Args:
+        bank: The CapBank object to handle.
+    Returns: A list of accounts
+    """
+    try:
+        accounts = list(bank.iter_accounts())
+    except NotImplementedError:
+        accounts = None
+    return accounts
+
+
+def convert_transactions(transactions, base_url, batch_size, spiller=None):
+    """
+    Convert transactions by batches of bounded size.
+
+    Args:
+        transactions: An iterable of Transaction objects.
+        base_url: An optional base url to generate full URLs.
+        batch_size: The maximum number of transactions converted at once.
+        spiller: An optional Spiller to write large lists to disk.
+    Returns:
+        The list of cleaned transactions, or a cursor dict if spilled to
+        disk.
+    """
+    transactions = itertools.chain.from_iterable(
+        clean_objects(batch, base_url=base_url)
+        for batch in iter_batches(transactions, batch_size)
+    )
+    if spiller is not None:
+        return spiller.spill(transactions)
+    return list(transactions)
+
+
+def fetch_history(bank, accounts, cursors=None, batch_size=DEFAULT_BATCH_SIZE,
+                  spiller=None):
+    """
+    Fetch and clean the transactions history of the accounts
+
+    Args:
+        bank: The CapBank object to handle.
+        accounts: A list of accounts for the CapBank object.
+        cursors: Optional TransactionCursors to only fetch unseen
+            transactions.
+        batch_size: The maximum number of transactions converted at once.
+        spiller: An optional Spiller to write large lists to disk.
+    Returns: A map of transactions for each account (None for the accounts
+        without history, such as loans for some modules).
+    """
+    # Get the BASEURL to generate absolute URLs
+    base_url = bank.browser.BASEURL
+    try:
+        assert accounts
+        history = {}
+        for account in accounts:
+            try:
+                transactions = bank.iter_history(account)
+                if cursors is not None:
+                    transactions = cursors.iter_new(account.id, transactions)
+                history[account.id] = convert_transactions(
+                    transactions, base_url, batch_size, spiller
+                )
+            except NotImplementedError:
+                history[account.id] = None
+    except AssertionError:
+        history = None
+    return history
+
+
+def fetch_coming(bank, accounts, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetch and clean the coming transactions of the accounts
+
+    Args:
+        bank: The CapBank object to handle.
+        accounts: A list of accounts for the CapBank object.
+        batch_size: The maximum number of transactions converted at once.
+    Returns: A map of coming transactions for each account.
+    """
+    # Get the BASEURL to generate absolute URLs
+    base_url = bank.browser.BASEURL
+    try:
+        assert accounts
+        coming = {}
+        for account in accounts:
+            try:
+                transactions = bank.iter_coming(account)
+                coming[account.id] = convert_transactions(
+                    transactions, base_url, batch_size
+                )
+            except NotImplementedError:
+                coming[account.id] = None
+    except AssertionError:
+        coming = None
+    return coming
+
+
+def to_cozy(bank, actions=None):
+    """
+    Export a CapBank object to a JSON-serializable dict, to pass it to Cozy
+    instance.
+
+    Args:
+        bank: The CapBank object to handle.
+        actions: A dict describing what should be fetched (see README.md).
+    Returns: A JSON-serializable dict for the input object.
+    """
+    # Handle default parameters
+    if actions is None:
+        actions = {"fetch": True, "download": False}
+
+    # Get the BASEURL to generate absolute URLs
+    base_url = bank.browser.BASEURL
+
+    # Handle fetch actions
+    if actions["fetch"] is False:
+        fetch_actions = []
+    elif actions["fetch"] is True:
+        fetch_actions = ["history", "coming"]
+    elif "CapBank" in actions["fetch"]:
+        fetch_actions = actions["fetch"]["CapBank"]
+    else:
+        fetch_actions = []
+    # Spill large sections to disk if asked to
+    spill = actions.get("spill", False)
+    if spill is False:
+        spiller = None
+    elif spill is True:
+        spiller = Spiller(DEFAULT_THRESHOLD)
+    else:
+        spiller = Spiller(spill)
+    columns = actions.get("format") == "columns"
+    batch_size = actions.get("batch_size", DEFAULT_BATCH_SIZE)
+
+    # Fetch items
+    accounts = fetch_accounts(bank)
+    cursors = None
+    if "history" in fetch_actions:
+        cursors = TransactionCursors(actions.get("cursors"))
+        history = fetch_history(bank, accounts, cursors, batch_size, spiller)
+    else:
+        history = None
+    if "coming" in fetch_actions:
+        coming = fetch_coming(bank, accounts, batch_size)
+    else:
+        coming = None
+    if columns:
+        history = columnize_sections(history)
+        coming = columnize_sections(coming)
+
+    # Format a dict with all the infos
+    fetched = {
+        "accounts": clean_objects(  # Clean the accounts list
+            accounts or [],
+            base_url=base_url
+        ),
+        "history": history,
+        "coming": coming,
+        "cursors": cursors.cursors if cursors is not None else None
+    }
+    return fetched
@@ -2,12 +2,137 @@
 This module contains all the conversion functions associated to the Document
 capability.
 """
+import logging
+import os
 import tempfile
 
-from cozyweboob.capabilities.base import clean_object
+from cozyweboob.capabilities.base import (account_key, clean_objects,
+                                          iter_clean_objects)
+from cozyweboob.tools.columnar import columnize_sections
+from cozyweboob.tools.env import get_data_dir
+from cozyweboob.tools.spill import DEFAULT_THRESHOLD, Spiller
+from cozyweboob.tools.storage import load_json, save_json
+from weboob.browser import need_login
+from weboob.capabilities.base import empty
 from weboob.capabilities.bill import Bill, DocumentNotFound, SubscriptionNotFound
 
 
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+
+def _open_url(browser, url):
+    """
+    Download the content at a given URL.
+
+    Args:
+        browser: The Weboob browser to use.
+        url: The URL to download.
+    Returns: The downloaded content.
+    """
+    return browser.open(url).content
+
+
+class DownloadPlanner(object):
+    """
+    Plan the download of documents, to avoid resolving them again from their
+    IDs (which usually means listing again all the subscriptions and
+    documents).
+
+    It keeps the Document objects fetched during the current run, and an
+    index of the documents URLs persisted across runs.
+    """
+    def __init__(self, document):
+        """
+        Args:
+            document: The CapDocument object to download from.
+        """
+        self.document = document
+        self.documents = {}
+        # Documents URLs are only valid for a given account
+        self.index_path = os.path.join(
+            get_data_dir("download_index"),
+            "%s.json" % account_key(document)
+        )
+        self.index = load_json(self.index_path, {})
+        self._index_changed = False
+
+    def add(self, documents):
+        """
+        Register fetched Document objects.
+
+        Args:
+            documents: An iterable of Document objects.
+        """
+        for doc in documents:
+            ids = [doc.id]
+            if doc.backend is not None:
+                ids.append(doc.fullid)
+            for doc_id in ids:
+                self.documents[doc_id] = doc
+                if (
+                        not empty(doc.url) and
+                        self.index.get(doc_id) != doc.url
+                ):
+                    self.index[doc_id] = doc.url
+                    self._index_changed = True
+
+    def save(self):
+        """
+        Persist the index of documents URLs, if it changed.
+        """
+        if self._index_changed:
+            save_json(self.index_path, self.index)
+            self._index_changed = False
+
+    def download(self, doc_id):
+        """
+        Download a document, directly from its URL if it is known.
+
+        Args:
+            doc_id: The ID of the document to download.
+        Returns:
+            The downloaded content.
+        """
+        doc = self.documents.get(doc_id)
+        if doc is None:
+            # Only known from a previous run, make sure to be logged in
+            url = self.index.get(doc_id)
+            if hasattr(self.document.browser, "do_login"):
+                open_url = need_login(_open_url)
+            else:
+                open_url = _open_url
+        elif empty(doc.has_file) or doc.has_file:
+            url = doc.url
+            open_url = _open_url
+        else:
+            url = None
+        if not empty(url):
+            try:
+                return open_url(self.document.browser, url)
+            except Exception as exception:
+                # The URL may have expired, fall back on the module
+                logger.info("Could not download %s from its URL: %s.",
+                            doc_id, exception)
+        if doc is not None:
+            doc_id = doc.id
+        return self.document.download_document(doc_id)
+
+
+def collect(items, spiller=None):
+    """
+    Collect cleaned items of a section, spilling them to disk if required.
+
+    Args:
+        items: An iterable of cleaned items.
+        spiller: An optional Spiller to write large lists to disk.
+    Returns: The list of items, or a cursor dict if spilled to disk.
+    """
+    if spiller is None:
+        return list(items)
+    return spiller.spill(items)
+
+
 def fetch_subscriptions(document):
     """
     Fetch the list of subscriptions
@@ -23,7 +148,7 @@ def fetch_subscriptions(document):
     return subscriptions
 
 
-def fetch_documents(document, subscriptions):
+def fetch_documents(document, subscriptions, planner=None):
     """
     Fetch and clean the list of bills
 
@@ -34,6 +159,7 @@ def fetch_documents(document, subscriptions):
     Args:
         document: The CapDocument object to handle.
         subscriptions: A list of subscriptions for the CapDocument object.
+        planner: An optional DownloadPlanner to register fetched documents.
     Returns: A tuple of cleaned list of documents and bills.
     """
     # Get the BASEURL to generate absolute URLs
@@ -44,6 +170,9 @@ def fetch_documents(document, subscriptions):
             subscription.id: list(document.iter_documents(subscription))
             for subscription in subscriptions
         }
+        if planner is not None:
+            for documents_list in raw_documents.values():
+                planner.add(documents_list)
         raw_bills = {
             subscription: [
                 bill for bill in documents if isinstance(bill, Bill)
@@ -51,18 +180,17 @@ def fetch_documents(document, subscriptions):
             for subscription, documents in raw_documents.items()
         }
         bills = {
-            subscription: [
-                clean_object(bill, base_url=base_url)
-                for bill in bills_list
-            ]
+            subscription: clean_objects(bills_list, base_url=base_url)
             for subscription, bills_list in raw_bills.items()
         }
         documents = {
-            subscription: [
-                clean_object(bill, base_url=base_url)
-                for bill in documents_list
-                if bill not in raw_bills[subscription]
-            ]
+            subscription: clean_objects(
+                (
+                    bill for bill in documents_list
+                    if bill not in raw_bills[subscription]
+                ),
+                base_url=base_url
+            )
             for subscription, documents_list in raw_documents.items()
         }
     except (NotImplementedError, AssertionError):
@@ -71,7 +199,7 @@ def fetch_documents(document, subscriptions):
     return documents, bills
 
 
-def fetch_details(document, subscriptions):
+def fetch_details(document, subscriptions, spiller=None):
     """
     Fetch and clean the list of details of the subscription (detailed
     consumption)
@@ -82,6 +210,7 @@ def fetch_details(document, subscriptions):
     Args:
         document: The CapDocument object to handle.
         subscriptions: A list of subscriptions for the CapDocument object.
+        spiller: An optional Spiller to write large lists to disk.
     Returns: A cleaned list of detailed bills.
     """
     # Get the BASEURL to generate absolute URLs
@@ -89,10 +218,11 @@ def fetch_details(document, subscriptions):
     try:
         assert subscriptions
         detailed_bills = {
-            subscription.id: [
-                clean_object(detailed_bill, base_url=base_url)
-                for detailed_bill in document.get_details(subscription)
-            ]
+            subscription.id: collect(
+                iter_clean_objects(document.get_details(subscription),
+                                   base_url=base_url),
+                spiller
+            )
             for subscription in subscriptions
         }
     except (NotImplementedError, AssertionError):
@@ -100,7 +230,7 @@ def fetch_details(document, subscriptions):
     return detailed_bills
 
 
-def fetch_history(document, subscriptions):
+def fetch_history(document, subscriptions, spiller=None):
     """
     Fetch and clean the list of history bills
 
@@ -110,6 +240,7 @@ def fetch_history(document, subscriptions):
     Args:
         document: The CapDocument object to handle.
         subscriptions: A list of subscriptions for the CapDocument object.
+        spiller: An optional Spiller to write large lists to disk.
     Returns: A cleaned list of history bills.
     """
     # Get the BASEURL to generate absolute URLs
@@ -117,11 +248,13 @@ def fetch_history(document, subscriptions):
     try:
         assert subscriptions
         history_bills = {
-            subscription.id: [
-                clean_object(history_bill, base_url=base_url)
-                for history_bill in
-                document.iter_documents_history(subscription)
-            ]
+            subscription.id: collect(
+                iter_clean_objects(
+                    document.iter_documents_history(subscription),
+                    base_url=base_url
+                ),
+                spiller
+            )
             for subscription in subscriptions
         }
     except (NotImplementedError, AssertionError):
@@ -129,13 +262,15 @@ def fetch_history(document, subscriptions):
     return history_bills
 
 
-def fetch(document, fetch_actions):
+def fetch(document, fetch_actions, spiller=None, planner=None):
     """
     Fetch all required items from a CapDocument object.
 
     Args:
         document: The CapDocument object to fetch from.
         fetch_actions: A dict describing what should be fetched (see README.md)
+        spiller: An optional Spiller to write large sections to disk.
+        planner: An optional DownloadPlanner to register fetched documents.
     Returns:
         A tuple of fetched subscriptions, documents, bills, detailed bills and
         history bills.
@@ -143,30 +278,32 @@ def fetch(document, fetch_actions):
     subscriptions = fetch_subscriptions(document)
 
     if fetch_actions is True or "documents" in fetch_actions:
-        documents, bills = fetch_documents(document, subscriptions)
+        documents, bills = fetch_documents(document, subscriptions, planner)
     else:
         documents, bills = None, None
 
     if fetch_actions is True or "detailed_bills" in fetch_actions:
-        detailed_bills = fetch_details(document, subscriptions)
+        detailed_bills = fetch_details(document, subscriptions, spiller)
     else:
         detailed_bills = None
 
     if fetch_actions is True or "history_bills" in fetch_actions:
-        history_bills = fetch_history(document, subscriptions)
+        history_bills = fetch_history(document, subscriptions, spiller)
     else:
         history_bills = None
 
     return (subscriptions, documents, bills, detailed_bills, history_bills)
 
 
-def download(document, ids):
+def download(document, ids, planner=None):
     """
     Download all required documents from a CapDocument object.
 
     Args:
         document: The CapDocument object to fetch from.
         ids: A list of document IDs to download.
+        planner: An optional DownloadPlanner, holding already fetched
+            documents.
     Returns:
         A dict associating requested IDs with paths to downloaded files. None
         if no ids are passed.
@@ -175,6 +312,9 @@ def download(document, ids):
         # Do not do anything if no ids are passed
         return None
 
+    if planner is None:
+        planner = DownloadPlanner(document)
+
     # Create a tmp directory to store downloaded items
     tmp_dir = tempfile.mkdtemp(suffix='-tmp', prefix='cozyweboob-')
 
@@ -182,12 +322,12 @@ def download(document, ids):
     downloaded_documents = {}
     for doc_id in ids:
         try:
-            downloaded_content = document.download_document(doc_id)
+            downloaded_content = planner.download(doc_id)
         except (DocumentNotFound, SubscriptionNotFound):
-            print(doc_id)
+            logger.error("Document %s not found.", doc_id)
             downloaded_documents[doc_id] = None
             continue
-        with tempfile.NamedTemporaryFile(mode="w+",
+        with tempfile.NamedTemporaryFile(mode="wb",
                                          dir=tmp_dir,
                                          delete=False) as tmp_file:
             tmp_file.write(downloaded_content)
@@ -227,9 +367,22 @@ def to_cozy(document, actions=None):
     # Force-fetch documents if download is set to True
     if actions["download"] is True and fetch_actions is not True:
         fetch_actions += ["documents"]
+    # Spill large sections to disk if asked to
+    spill = actions.get("spill", False)
+    if spill is False:
+        spiller = None
+    elif spill is True:
+        spiller = Spiller(DEFAULT_THRESHOLD)
+    else:
+        spiller = Spiller(spill)
+    # Keep track of fetched documents to download them afterwards
+    if actions["download"] is False:
+        planner = None
+    else:
+        planner = DownloadPlanner(document)
     # Fetch items
     subscriptions, documents, bills, detailed_bills, history_bills = fetch(
-        document, fetch_actions)
+        document, fetch_actions, spiller, planner)
 
     # Handle download actions
     if actions["download"] is False:
@@ -246,16 +399,23 @@ def to_cozy(document, actions=None):
                     download_ids.append(bill["id"])
         else:
             download_ids = actions["download"]["CapDocument"]
-        downloaded_documents = download(document, download_ids)
+        downloaded_documents = download(document, download_ids, planner)
+        planner.save()
     else:
         downloaded_documents = None
 
+    # Use the compact column-oriented format for large sections if asked to
+    if actions.get("format") == "columns":
+        bills = columnize_sections(bills)
+        detailed_bills = columnize_sections(detailed_bills)
+        history_bills = columnize_sections(history_bills)
+
     # Return a formatted dict with all the infos
     return {
-        "subscriptions": [  # Clean the subscriptions list
-            clean_object(subscription, base_url=base_url)
-            for subscription in subscriptions
-        ],
+        "subscriptions": clean_objects(  # Clean the subscriptions list
+            subscriptions,
+            base_url=base_url
+        ),
         "bills": bills,
         "detailed_bills": detailed_bills,
         "documents": documents,
@@ -1,8 +1,10 @@
 """
 Capabilities submodule
 """
+from cozyweboob.capabilities import CapBank
 from cozyweboob.capabilities import CapDocument
 
 __all__ = [
+    "CapBank",
     "CapDocument"
 ]
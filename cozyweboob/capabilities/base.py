@@ -1,7 +1,38 @@
 """
 Common conversion functions for all the available capabilities.
 """
-from weboob.capabilities.base import empty
+import hashlib
+
+from datetime import date
+from decimal import Decimal
+
+from weboob.capabilities.base import BaseObject, empty
+
+
+# Field conversion kinds
+PLAIN_FIELD = 0
+URL_FIELD = 1
+DATE_FIELD = 2
+DECIMAL_FIELD = 3
+GENERIC_FIELD = 4
+
+
+def account_key(backend):
+    """
+    Identify the account a backend is configured for, to persist data across
+    runs. Secret configuration options (such as passwords) are not used.
+
+    Args:
+        backend: The Weboob backend.
+    Returns:
+        a key made of the backend name and a hash of its configuration.
+    """
+    config = hashlib.sha1(repr(sorted(
+        (name, value.get())
+        for name, value in backend.config.items()
+        if not value.masked
+    )).encode("utf-8")).hexdigest()
+    return "%s-%s" % (backend.name, config)
 
 
 def clean_object(obj, base_url=None):
@@ -27,3 +58,164 @@ def clean_object(obj, base_url=None):
             # Render full absolute URLs
             obj[key] = base_url + value
     return obj
+
+
+def to_primitive(value):
+    """
+    Convert a field value to a JSON primitive, the same way CustomJSONEncoder
+    would do.
+
+    Args:
+        value: A field value, already cleaned from empty values.
+    Returns:
+        a JSON primitive for the value.
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    elif isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def field_kind(name, field):
+    """
+    Find out how to convert a given field.
+
+    Args:
+        name: The field name.
+        field: The Weboob Field definition.
+    Returns:
+        the conversion kind of the field.
+    """
+    types = [x for x in field.types if isinstance(x, type)]
+    if name == "url":
+        return URL_FIELD
+    elif len(types) != len(field.types) or not types:
+        # Lazily resolved or untyped fields
+        return GENERIC_FIELD
+    elif all(issubclass(x, date) for x in types):
+        return DATE_FIELD
+    elif all(issubclass(x, Decimal) for x in types):
+        return DECIMAL_FIELD
+    elif any(issubclass(x, (date, Decimal)) for x in types):
+        return GENERIC_FIELD
+    return PLAIN_FIELD
+
+
+class ConversionPlan(object):
+    """
+    Conversion plan of the objects of a given Weboob class to dicts of JSON
+    primitives. Plans are compiled once per class, see get_plan.
+    """
+    def __init__(self, cls):
+        """
+        Compile the plan for a given class.
+
+        Args:
+            cls: A class deriving from BaseObject.
+        """
+        # Objects with custom fields iteration can't be planned. Compare the
+        # underlying functions, unbound methods are new objects on each
+        # access in Python 2.
+        self.generic = (
+            getattr(cls.iter_fields, "__func__", cls.iter_fields) is not
+            getattr(BaseObject.iter_fields, "__func__",
+                    BaseObject.iter_fields)
+        )
+        self.fields = [
+            (name, field_kind(name, field))
+            for name, field in (cls._fields or {}).items()
+        ]
+
+    def convert(self, obj, base_url=None):
+        """
+        Convert an object to a dict of JSON primitives.
+
+        Args:
+            obj: The object to handle, an instance of the planned class.
+            base_url: An optional base url to generate full URLs.
+        Returns:
+            a dict of JSON primitives for the input object.
+        """
+        if self.generic:
+            return {
+                key: to_primitive(value)
+                for key, value in clean_object(obj, base_url).items()
+            }
+        converted = {}
+        if obj.id is not None:
+            if obj.backend is not None:
+                converted["id"] = obj.fullid
+            else:
+                converted["id"] = obj.id
+        fields = obj._fields
+        for name, kind in self.fields:
+            value = fields[name].value
+            if empty(value):
+                value = None
+            elif kind == PLAIN_FIELD:
+                pass
+            elif kind == URL_FIELD:
+                if base_url:
+                    value = base_url + value
+            elif kind == DATE_FIELD:
+                value = value.isoformat()
+            elif kind == DECIMAL_FIELD:
+                value = str(value)
+            else:
+                value = to_primitive(value)
+            converted[name] = value
+        return converted
+
+
+# Cache of compiled conversion plans, by class
+_PLANS = {}
+
+
+def get_plan(cls):
+    """
+    Get the conversion plan for a given class, compiling it if needed.
+
+    Args:
+        cls: A class deriving from BaseObject.
+    Returns:
+        the ConversionPlan for this class.
+    """
+    try:
+        return _PLANS[cls]
+    except KeyError:
+        plan = _PLANS[cls] = ConversionPlan(cls)
+        return plan
+
+
+def iter_clean_objects(objs, base_url=None):
+    """
+    Batch version of clean_object, converting objects directly to JSON
+    primitives using per-class conversion plans.
+
+    Args:
+        objs: An iterable of objects deriving from BaseObject.
+        base_url: An optional base url to generate full URLs in output dicts.
+    Returns:
+        a generator of JSON-serializable dicts.
+    """
+    plans = _PLANS
+    for obj in objs:
+        cls = obj.__class__
+        plan = plans.get(cls)
+        if plan is None:
+            plan = get_plan(cls)
+        yield plan.convert(obj, base_url)
+
+
+def clean_objects(objs, base_url=None):
+    """
+    Batch version of clean_object, see iter_clean_objects.
+
+    Args:
+        objs: An iterable of objects deriving from BaseObject.
+        base_url: An optional base url to generate full URLs in output dicts.
+    Returns:
+        a list of JSON-serializable dicts.
+    """
+    return list(iter_clean_objects(objs, base_url))
@@ -0,0 +1,251 @@
+"""
+Per-module circuit breakers, to quickly skip konnectors of failing websites.
+
+A breaker counts the recent failures of a Weboob module. Once they reach a
+threshold, the breaker opens and konnectors of this module fail immediately
+for a cooldown period. After the cooldown, a single probe run is let through
+(half-open state): the breaker closes again if it succeeds, and reopens
+otherwise.
+
+Errors specific to an account (wrong credentials, action needed on the
+website...) do not tell anything about the website health and are not counted.
+"""
+import collections
+import re
+import threading
+import time
+
+from cozyweboob.tools.columnar import STRING_TYPES
+from cozyweboob.tools.env import get_int_env
+
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Errors not counted as module failures, by exception class name
+IGNORED_ERRORS = frozenset([
+    "ActionNeeded",
+    "AppValidationCancelled",
+    "AppValidationExpired",
+    "AuthMethodNotImplemented",
+    # Worker nodes did not run the konnector, not the website fault
+    "BatchTimeoutError",
+    "BrowserBanned",
+    "BrowserIncorrectPassword",
+    "BrowserPasswordExpired",
+    "BrowserQuestion",
+    "CircuitOpenError",
+    "NoAccountsException",
+    "ValidationError"
+])
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a konnector is skipped because its module breaker is open.
+    """
+    pass
+
+
+def error_type(error):
+    """
+    Get the type name of an error, which might have been turned into its
+    string representation (see WorkerPool).
+
+    Args:
+        error: An exception or its repr string.
+    Returns: The exception class name.
+    """
+    if isinstance(error, STRING_TYPES):
+        match = re.match(r"^([\w.]+)\(", error)
+        if match is None:
+            return "Exception"
+        return match.group(1).rsplit(".", 1)[-1]
+    return error.__class__.__name__
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of a single module. Not thread-safe, see
+    CircuitBreakerRegistry.
+    """
+    def __init__(self, threshold, cooldown, window):
+        """
+        Args:
+            threshold: Number of failures within the window opening the
+                breaker.
+            cooldown: Time the breaker stays open, in seconds.
+            window: Time window to count failures in, in seconds.
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.window = window
+        self.state = CLOSED
+        # Recent failures, as tuples of their timestamp and error type
+        self.failures = collections.deque()
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self, now):
+        """
+        Check whether a konnector run is allowed, switching to the half-open
+        state once the cooldown is over.
+
+        Args:
+            now: The current timestamp.
+        Returns: true / false
+        """
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN:
+            if self.probing:
+                # Only a single probe at a time
+                return False
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def record(self, error, now):
+        """
+        Record the outcome of a konnector run.
+
+        Args:
+            error: The error of the run, or None if it succeeded.
+            now: The current timestamp.
+        """
+        if error is not None and error_type(error) in IGNORED_ERRORS:
+            # Nothing to learn about the website, release the probe slot
+            self.probing = False
+            return
+        if error is None:
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.failures.clear()
+            self.probing = False
+            return
+        self.failures.append((now, error_type(error)))
+        while self.failures and self.failures[0][0] < now - self.window:
+            self.failures.popleft()
+        if self.state == HALF_OPEN or len(self.failures) >= self.threshold:
+            self.state = OPEN
+            self.opened_at = now
+            self.probing = False
+
+    def to_dict(self, now):
+        """
+        Get the state of this breaker.
+
+        Args:
+            now: The current timestamp.
+        Returns: A JSON-serializable dict.
+        """
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = max(self.opened_at + self.cooldown - now, 0)
+        error_types = collections.Counter(
+            error for failure, error in self.failures
+            if failure >= now - self.window
+        )
+        return {
+            "state": self.state,
+            "failures": sum(error_types.values()),
+            "error_types": dict(error_types),
+            "retry_in": retry_in
+        }
+
+
+class CircuitBreakerRegistry(object):
+    """
+    Circuit breakers of all the modules, by module name.
+    """
+    def __init__(self, threshold=None, cooldown=None, window=None):
+        """
+        Args:
+            threshold: Number of failures opening a breaker. Defaults to
+                COZYWEBOOB_BREAKER_THRESHOLD or 5, 0 disables the breakers.
+            cooldown: Time a breaker stays open, in seconds. Defaults to
+                COZYWEBOOB_BREAKER_COOLDOWN or 60.
+            window: Time window to count failures in, in seconds. Defaults to
+                COZYWEBOOB_BREAKER_WINDOW or 300.
+        """
+        if threshold is None:
+            threshold = get_int_env("COZYWEBOOB_BREAKER_THRESHOLD", 5)
+        if cooldown is None:
+            cooldown = get_int_env("COZYWEBOOB_BREAKER_COOLDOWN", 60)
+        if window is None:
+            window = get_int_env("COZYWEBOOB_BREAKER_WINDOW", 300)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.window = window
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, modulename):
+        """
+        Get the breaker of a module, creating it if needed. Must be called
+        with the lock held.
+
+        Args:
+            modulename: The name of the module.
+        Returns: The CircuitBreaker.
+        """
+        breaker = self.breakers.get(modulename)
+        if breaker is None:
+            breaker = self.breakers[modulename] = CircuitBreaker(
+                self.threshold, self.cooldown, self.window
+            )
+        return breaker
+
+    def check(self, konnector):
+        """
+        Check whether a konnector can run. Every allowed run must then be
+        recorded, see record.
+
+        Args:
+            konnector: A konnector description dict.
+        Raises:
+            CircuitOpenError if the breaker of its module is open.
+        """
+        if self.threshold <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            breaker = self._get(konnector["name"])
+            if breaker.allow(now):
+                return
+            state = breaker.to_dict(now)
+        raise CircuitOpenError(
+            "Module %s is failing, skipped (breaker %s)." % (
+                konnector["name"], state["state"]
+            )
+        )
+
+    def record(self, konnector, result):
+        """
+        Record the outcome of a konnector run.
+
+        Args:
+            konnector: A konnector description dict.
+            result: The results dict of this konnector.
+        """
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self._get(konnector["name"]).record(result.get("error"),
+                                                time.time())
+
+    def states(self):
+        """
+        Get the states of all the breakers.
+
+        Returns: A JSON-serializable dict of breakers states, by module name.
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                modulename: breaker.to_dict(now)
+                for modulename, breaker in self.breakers.items()
+            }
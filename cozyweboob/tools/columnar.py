@@ -0,0 +1,101 @@
+"""
+This module implements a compact column-oriented format for large lists of
+cleaned objects.
+
+A list of dicts is stored as a dict of columns, one list of values per key.
+Columns of strings with many repeated values (currencies, labels...) are
+dictionary encoded: the column then holds indices into a list of distinct
+values.
+"""
+
+# Strings types, for both Python 2 and 3
+STRING_TYPES = (str, type(u""))
+
+
+def to_columns(rows):
+    """
+    Convert a list of dicts to the column-oriented format.
+
+    Note: A key missing from a given row is stored as a null value.
+
+    Args:
+        rows: A list of JSON-serializable dicts.
+    Returns:
+        a JSON-serializable dict, with a "columns" dict of columns, a
+        "dictionaries" dict of the distinct values of dictionary encoded
+        columns and the "count" of rows.
+    """
+    keys = set()
+    for row in rows:
+        keys.update(row)
+    columns = {}
+    dictionaries = {}
+    for key in keys:
+        column = [row.get(key) for row in rows]
+        columns[key] = column
+        if not all(x is None or isinstance(x, STRING_TYPES) for x in column):
+            continue
+        distinct = {}
+        for value in column:
+            if value is not None and value not in distinct:
+                distinct[value] = len(distinct)
+        # Only worth it if values are repeated
+        if len(distinct) * 2 > len(column):
+            continue
+        columns[key] = [
+            distinct[value] if value is not None else None
+            for value in column
+        ]
+        dictionary = [None] * len(distinct)
+        for value, index in distinct.items():
+            dictionary[index] = value
+        dictionaries[key] = dictionary
+    return {
+        "format": "columns",
+        "count": len(rows),
+        "columns": columns,
+        "dictionaries": dictionaries
+    }
+
+
+def from_columns(section):
+    """
+    Convert back a section in the column-oriented format to a list of dicts.
+
+    Args:
+        section: A dict as returned by to_columns.
+    Returns:
+        the list of dicts.
+    """
+    columns = {}
+    for key, column in section["columns"].items():
+        dictionary = section["dictionaries"].get(key)
+        if dictionary is not None:
+            column = [
+                dictionary[index] if index is not None else None
+                for index in column
+            ]
+        columns[key] = column
+    return [
+        {key: column[i] for key, column in columns.items()}
+        for i in range(section["count"])
+    ]
+
+
+def columnize_sections(sections):
+    """
+    Convert a map of lists of dicts (typically a map of bills for each
+    subscription) to the column-oriented format. Sections which are not lists
+    (not fetched or spilled to disk) are left untouched.
+
+    Args:
+        sections: A dict associating keys to lists of dicts, or None.
+    Returns:
+        the converted dict.
+    """
+    if sections is None:
+        return None
+    return {
+        key: to_columns(rows) if isinstance(rows, list) else rows
+        for key, rows in sections.items()
+    }
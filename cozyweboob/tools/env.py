@@ -15,3 +15,43 @@ def is_in_debug_mode():
         "COZYWEBOOB_ENV" in os.environ and
         os.environ["COZYWEBOOB_ENV"] == "debug"
     )
+
+
+def get_int_env(name, default):
+    """
+    Read an integer setting from the environment.
+
+    Args:
+        name: The environment variable name.
+        default: The value to use if the variable is not set or invalid.
+    Returns:
+        the integer value.
+    """
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def get_data_dir(*parts):
+    """
+    Get a directory to persist data across runs, creating it if needed. It is
+    set by the COZYWEBOOB_DATA_DIR environment variable and defaults to
+    ~/.local/share/cozyweboob.
+
+    Args:
+        parts: Optional path components of a subdirectory to get.
+    Returns:
+        the absolute path to the directory.
+    """
+    data_dir = os.path.join(
+        os.environ.get(
+            "COZYWEBOOB_DATA_DIR",
+            os.path.join(os.path.expanduser("~"), ".local", "share",
+                         "cozyweboob")
+        ),
+        *parts
+    )
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    return os.path.abspath(data_dir)
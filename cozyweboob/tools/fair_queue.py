@@ -0,0 +1,262 @@
+"""
+Fair-share scheduling of konnectors runs between tenants.
+
+Konnectors runs are queued per tenant and per priority class. Interactive runs
+are always served before bulk ones. Within a class, tenants are served using
+start-time fair queuing, so that each tenant gets a share of the runs
+proportional to its weight, whatever the number of konnectors it submitted.
+Queues have a maximum depth per tenant, above which submissions are rejected
+right away.
+"""
+import collections
+import heapq
+import itertools
+import math
+import threading
+import time
+
+
+# Priority classes, served in this order
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class BatchTooLargeError(ValueError):
+    """
+    Raised when a submission can't fit in a tenant queue, even when empty.
+    """
+    pass
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a tenant queue is full.
+    """
+    def __init__(self, message, retry_after):
+        """
+        Args:
+            message: A description of the error.
+            retry_after: Estimated time before retrying, in seconds.
+        """
+        super(QueueFullError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_weights(value):
+    """
+    Parse tenants weights, such as "tenant1=2,tenant2=0.5".
+
+    Args:
+        value: The weights string, possibly empty.
+    Returns: A dict of weights by tenant.
+    Raises:
+        ValueError if a weight is not a positive number.
+    """
+    weights = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        tenant, weight = item.rsplit("=", 1)
+        weight = float(weight)
+        if not weight > 0:
+            raise ValueError("Weight of tenant %s should be positive." %
+                             tenant.strip())
+        weights[tenant.strip()] = weight
+    return weights
+
+
+class Job(object):
+    """
+    A queued run.
+    """
+    def __init__(self, tenant, priority, item):
+        """
+        Args:
+            tenant: The tenant submitting this run.
+            priority: The priority class of this run.
+            item: The item to run.
+        """
+        self.tenant = tenant
+        self.priority = priority
+        self.item = item
+        self.submitted = time.time()
+        self.started = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def queue_delay(self):
+        """
+        Time this job waited in queue, in seconds.
+        """
+        return (self.started or time.time()) - self.submitted
+
+
+class FairScheduler(object):
+    """
+    Run items from per-tenant queues on a fixed number of threads.
+    """
+    def __init__(self, run, concurrency=1, max_depth=1000, weights=None):
+        """
+        Args:
+            run: The function to call on each item.
+            concurrency: Number of items run concurrently.
+            max_depth: Maximum number of queued items per tenant.
+            weights: A dict of weights by tenant, defaults to 1.
+        """
+        self.run = run
+        self.concurrency = max(concurrency, 1)
+        self.max_depth = max_depth
+        self.weights = weights or {}
+        self.condition = threading.Condition()
+        # Heaps of queued jobs, by priority class, ordered by start tag
+        self.queues = {priority: [] for priority in PRIORITIES}
+        self.virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        # Finish tag of the last queued job, by priority class and tenant
+        self.finish_tags = {}
+        self.depths = collections.Counter()
+        self.sequence = itertools.count()
+        # Moving average of the run durations, to estimate retry delays
+        self.average_duration = 1.0
+        self.threads = [
+            threading.Thread(target=self._work)
+            for _ in range(self.concurrency)
+        ]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def retry_after(self):
+        """
+        Estimate the time before queues get some room. Must be called with
+        the condition held.
+
+        Returns: A number of seconds.
+        """
+        queued = sum(self.depths.values())
+        return max(int(math.ceil(
+            queued * self.average_duration / self.concurrency
+        )), 1)
+
+    def submit(self, tenant, priority, items):
+        """
+        Queue items for a tenant.
+
+        Args:
+            tenant: The tenant submitting the items.
+            priority: The priority class of the items.
+            items: A list of items to run.
+        Returns: The list of queued Job.
+        Raises:
+            BatchTooLargeError if there are more items than the maximum
+            queue depth.
+            QueueFullError if the tenant queue can't hold all the items.
+        """
+        if priority not in self.queues:
+            raise ValueError("Unknown priority class: %s." % priority)
+        if len(items) > self.max_depth:
+            raise BatchTooLargeError(
+                "Too many konnectors, at most %d can be queued." % (
+                    self.max_depth,
+                )
+            )
+        weight = self.weights.get(tenant, 1.0)
+        jobs = []
+        with self.condition:
+            if self.depths[tenant] + len(items) > self.max_depth:
+                raise QueueFullError("Queue of tenant %s is full." % tenant,
+                                     self.retry_after())
+            for item in items:
+                job = Job(tenant, priority, item)
+                start = max(self.virtual_time[priority],
+                            self.finish_tags.get((priority, tenant), 0.0))
+                self.finish_tags[(priority, tenant)] = start + 1.0 / weight
+                heapq.heappush(self.queues[priority],
+                               (start, next(self.sequence), job))
+                jobs.append(job)
+            self.depths[tenant] += len(items)
+            self.condition.notify(len(items))
+        return jobs
+
+    def map(self, tenant, priority, items):
+        """
+        Run items for a tenant, waiting for all of them to complete.
+
+        Args:
+            tenant: The tenant submitting the items.
+            priority: The priority class of the items.
+            items: A list of items to run.
+        Returns:
+            A tuple of the list of results and the maximum queueing delay of
+            the items, in seconds.
+        Raises:
+            BatchTooLargeError if there are more items than the maximum
+            queue depth.
+            QueueFullError if the tenant queue can't hold all the items.
+        """
+        jobs = self.submit(tenant, priority, items)
+        for job in jobs:
+            job.done.wait()
+        for job in jobs:
+            if job.error is not None:
+                raise job.error
+        return (
+            [job.result for job in jobs],
+            max([job.queue_delay for job in jobs] or [0])
+        )
+
+    def _next(self):
+        """
+        Wait for the next job to run.
+
+        Returns: The Job.
+        """
+        with self.condition:
+            while True:
+                for priority in PRIORITIES:
+                    queue = self.queues[priority]
+                    if queue:
+                        start, _, job = heapq.heappop(queue)
+                        self.virtual_time[priority] = start
+                        self.depths[job.tenant] -= 1
+                        if not self.depths[job.tenant]:
+                            del self.depths[job.tenant]
+                        return job
+                self.condition.wait()
+
+    def _work(self):
+        """
+        Run jobs forever.
+        """
+        while True:
+            job = self._next()
+            job.started = time.time()
+            try:
+                job.result = self.run(job.item)
+            except Exception as exception:
+                job.error = exception
+            duration = time.time() - job.started
+            with self.condition:
+                self.average_duration = (
+                    0.9 * self.average_duration + 0.1 * duration
+                )
+            job.done.set()
+
+    def stats(self):
+        """
+        Get the state of the queues.
+
+        Returns: A JSON-serializable dict, with the number of queued items by
+            tenant and by priority class.
+        """
+        with self.condition:
+            return {
+                "tenants": dict(self.depths),
+                "priorities": {
+                    priority: len(queue)
+                    for priority, queue in self.queues.items()
+                },
+                "average_duration": self.average_duration
+            }
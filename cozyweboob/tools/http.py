@@ -0,0 +1,44 @@
+"""
+Helper functions related to HTTP.
+"""
+import gzip
+import io
+
+
+def accepts_encoding(accept_encoding, encoding):
+    """
+    Check whether a content encoding is accepted by the client.
+
+    Args:
+        accept_encoding: The Accept-Encoding header value.
+        encoding: The content encoding to check, e.g. "gzip".
+    Returns:
+        true / false
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        params = [x.strip() for x in item.split(";")]
+        quality = 1.0
+        for param in params[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[params[0].lower()] = quality
+    return qualities.get(encoding, qualities.get("*", 0.0)) > 0
+
+
+def gzip_compress(data):
+    """
+    Gzip compress some data.
+
+    Args:
+        data: The bytes to compress.
+    Returns:
+        the compressed bytes.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+        gzip_file.write(data)
+    return buffer.getvalue()
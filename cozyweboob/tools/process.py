@@ -0,0 +1,25 @@
+"""
+Helper functions related to the current process.
+"""
+import os
+import resource
+import sys
+
+
+def get_rss():
+    """
+    Get the resident set size of the current process.
+
+    Returns:
+        the current RSS, in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        # No procfs, fall back on the peak RSS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            # Reported in bytes on OS X and in kilobytes elsewhere
+            return max_rss
+        return max_rss * 1024
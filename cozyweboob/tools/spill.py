@@ -0,0 +1,157 @@
+"""
+This module implements spilling of large result sections to disk, and paging
+through them afterwards.
+
+Spilled sections are stored as JSON lines files in "cozyweboob-*-tmp" folders
+of the system tmp dir, so that they are removed by the clean action. A sparse
+index of line offsets is stored alongside each file, to be able to seek to any
+page without reading the whole file.
+"""
+import itertools
+import json
+import os
+import tempfile
+
+from cozyweboob.tools.jsonwriter import json_dump
+
+
+# Number of items between two entries of the offsets index
+INDEX_STEP = 1000
+# Default number of items in a section before spilling it to disk
+DEFAULT_THRESHOLD = 1000
+# Default number of items per page
+DEFAULT_PAGE_LIMIT = 100
+
+
+class Spiller(object):
+    """
+    Spill sections with too many items to disk, replacing them by a cursor.
+    """
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        """
+        Args:
+            threshold: Maximum number of items to keep in memory for a given
+                section.
+        """
+        self.threshold = threshold
+        self._tmp_dir = None
+
+    @property
+    def tmp_dir(self):
+        """
+        Tmp directory to store spilled sections, created on first use.
+        """
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(suffix='-tmp',
+                                             prefix='cozyweboob-')
+        return self._tmp_dir
+
+    def spill(self, items):
+        """
+        Consume an iterable of JSON-serializable items, spilling it to disk if
+        it has more than threshold items.
+
+        Args:
+            items: An iterable of JSON-serializable items.
+        Returns:
+            The list of items if small enough, a cursor dict otherwise.
+        """
+        buffered = []
+        items = iter(items)
+        for item in items:
+            buffered.append(item)
+            if len(buffered) > self.threshold:
+                return self._write(itertools.chain(buffered, items))
+        return buffered
+
+    def _write(self, items):
+        """
+        Write items to a spill file, incrementally.
+
+        Args:
+            items: An iterable of JSON-serializable items.
+        Returns:
+            A cursor dict for the written items.
+        """
+        offsets = []
+        count = 0
+        with tempfile.NamedTemporaryFile(mode="wb",
+                                         dir=self.tmp_dir,
+                                         suffix=".ndjson",
+                                         delete=False) as spill_file:
+            for item in items:
+                if count % INDEX_STEP == 0:
+                    offsets.append(spill_file.tell())
+                spill_file.write(json_dump(item).encode("utf-8") + b"\n")
+                count += 1
+        with open(spill_file.name + ".idx", "w") as index_file:
+            json.dump({"count": count, "offsets": offsets}, index_file)
+        return {
+            "cursor": os.path.relpath(spill_file.name, tempfile.gettempdir()),
+            "count": count
+        }
+
+
+def _cursor_path(cursor):
+    """
+    Get back the path of a spill file from its cursor, ensuring it does not
+    point outside of the cozyweboob tmp folders.
+
+    Args:
+        cursor: The cursor of a spilled section.
+    Returns:
+        The absolute path to the spill file.
+    """
+    sys_tmp_dir = os.path.realpath(tempfile.gettempdir())
+    path = os.path.realpath(os.path.join(sys_tmp_dir, cursor))
+    tmp_dir, filename = os.path.split(path)
+    parent_dir, tmp_dir_name = os.path.split(tmp_dir)
+    if (
+            parent_dir != sys_tmp_dir or
+            not tmp_dir_name.startswith("cozyweboob-") or
+            not tmp_dir_name.endswith("-tmp") or
+            not filename.endswith(".ndjson") or
+            not os.path.isfile(path) or
+            # The index is written last, spill may have been interrupted
+            not os.path.isfile(path + ".idx")
+    ):
+        raise ValueError("Invalid cursor: %s." % cursor)
+    return path
+
+
+def read_page(cursor, offset=0, limit=DEFAULT_PAGE_LIMIT):
+    """
+    Read a page of items from a spilled section.
+
+    Args:
+        cursor: The cursor of a spilled section, as returned in fetched data.
+        offset: Index of the first item to return.
+        limit: Maximum number of items to return.
+    Returns:
+        A JSON-serializable dict with the requested items.
+    """
+    offset = max(int(offset), 0)
+    limit = max(int(limit), 0)
+    path = _cursor_path(cursor)
+    try:
+        with open(path + ".idx") as index_file:
+            index = json.load(index_file)
+        items = []
+        if offset < index["count"] and limit:
+            with open(path, "rb") as spill_file:
+                # Seek to the closest indexed line and skip the remaining ones
+                spill_file.seek(index["offsets"][offset // INDEX_STEP])
+                lines = itertools.islice(spill_file,
+                                         offset % INDEX_STEP,
+                                         offset % INDEX_STEP + limit)
+                items = [json.loads(line.decode("utf-8")) for line in lines]
+    except (IOError, OSError):
+        # Files deleted in the meantime (by /clean for instance)
+        raise ValueError("Invalid cursor: %s." % cursor)
+    return {
+        "cursor": cursor,
+        "offset": offset,
+        "limit": limit,
+        "count": index["count"],
+        "items": items
+    }
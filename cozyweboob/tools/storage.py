@@ -0,0 +1,45 @@
+"""
+Helper functions to persist JSON data on disk.
+"""
+import json
+import os
+import tempfile
+
+from cozyweboob.tools.jsonwriter import CustomJSONEncoder
+
+
+def load_json(path, default=None):
+    """
+    Load a JSON file.
+
+    Args:
+        path: Path to the JSON file.
+        default: Value to return if the file does not exist or is invalid.
+    Returns:
+        the loaded JSON data.
+    """
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def save_json(path, obj):
+    """
+    Atomically write a JSON file, so that concurrent readers never see a
+    partially written file.
+
+    Args:
+        path: Path to the JSON file.
+        obj: The JSON-serializable object to write.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(obj, tmp_file, cls=CustomJSONEncoder)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,236 @@
+"""
+Validation of konnectors descriptions against the configuration options of
+their Weboob module, before building any backend.
+
+Checks mirror the ones done by Weboob when loading a backend configuration.
+Schemas are derived from the modules configuration descriptions (see
+weboob_tools.dictify_config_desc), compiled once, and cached both in memory
+and on disk.
+"""
+import os
+import re
+import threading
+
+from cozyweboob.tools.columnar import STRING_TYPES
+from cozyweboob.tools.env import get_data_dir
+from cozyweboob.tools.storage import load_json, save_json
+
+
+# Accepted values for boolean parameters
+BOOLEAN_VALUES = ('y', 'yes', '1', 'true', 'on', 'n', 'no', '0', 'false',
+                  'off')
+
+
+class ValidationError(Exception):
+    """
+    Raised when a konnector description is invalid.
+    """
+    def __init__(self, message, errors=None):
+        """
+        Args:
+            message: A description of the error.
+            errors: A dict associating invalid fields to error messages.
+        """
+        super(ValidationError, self).__init__(message)
+        self.errors = errors or {}
+
+
+class ParameterSchema(object):
+    """
+    Compiled schema of the parameters of a Weboob module.
+    """
+    def __init__(self, config_desc):
+        """
+        Args:
+            config_desc: The dict of configuration options of the module, as
+                returned by dictify_config_desc.
+        """
+        self.fields = []
+        for name, desc in config_desc.items():
+            regexp = desc.get("regexp")
+            choices = desc.get("choices")
+            if choices is not None:
+                choices = set(choices) | set(desc.get("aliases") or ())
+            self.fields.append((
+                name,
+                desc["type"],
+                desc["required"],
+                desc["default"],
+                re.compile(regexp + "$") if regexp is not None else None,
+                choices
+            ))
+
+    @staticmethod
+    def check_value(value, value_type, default, regexp, choices):
+        """
+        Check a single parameter value.
+
+        Args:
+            value: The value to check.
+            value_type: The type of the value, as returned by Value_to_string.
+            default: The default value.
+            regexp: A compiled regexp the value should match, or None.
+            choices: A set of allowed values, or None.
+        Returns:
+            An error message, or None if the value is valid.
+        """
+        if value_type == "password" and value == "":
+            # Weboob always allow empty passwords
+            return None
+        if value_type == "bool":
+            if (
+                    not isinstance(value, bool) and
+                    str(value).lower() not in BOOLEAN_VALUES
+            ):
+                return "Value is not a boolean."
+            return None
+        if value_type == "float":
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                return "Value is not a float value."
+            return None
+        if value == default:
+            return None
+        if value == "" and default != "" and (
+                choices is None or value not in choices
+        ):
+            return "Value can't be empty."
+        if regexp is not None and not regexp.match(u"%s" % (value,)):
+            return "Value does not match regexp \"%s\"." % (
+                regexp.pattern[:-1],
+            )
+        if choices is not None and value not in choices:
+            return "Value is not in the list of allowed values."
+        return None
+
+    def validate(self, parameters):
+        """
+        Validate the parameters of a konnector.
+
+        Args:
+            parameters: The dict of parameters of the konnector.
+        Returns:
+            A dict associating invalid parameters to error messages.
+        """
+        errors = {}
+        for name, value_type, required, default, regexp, choices in (
+                self.fields
+        ):
+            value = parameters.get(name)
+            if value is None:
+                if required:
+                    errors[name] = "Missing parameter."
+                continue
+            error = self.check_value(value, value_type, default, regexp,
+                                     choices)
+            if error is not None:
+                errors[name] = error
+        return errors
+
+
+class SchemaCache(object):
+    """
+    Cache of compiled parameters schemas, by module name.
+    """
+    def __init__(self, weboob_proxy_factory, cache_dir=None):
+        """
+        Args:
+            weboob_proxy_factory: A callable returning a WeboobProxy, used to
+                load the modules configuration options when needed.
+            cache_dir: Directory where schemas are persisted.
+        """
+        self.weboob_proxy_factory = weboob_proxy_factory
+        self.cache_dir = cache_dir
+        # Tuples of module version and schema, by module name
+        self.schemas = {}
+        self._weboob_proxy = None
+        self._lock = threading.Lock()
+
+    @property
+    def weboob_proxy(self):
+        """
+        WeboobProxy used to load the configuration options, built on first
+        use.
+        """
+        if self._weboob_proxy is None:
+            self._weboob_proxy = self.weboob_proxy_factory()
+        return self._weboob_proxy
+
+    def get(self, modulename):
+        """
+        Get the compiled schema of a module, reloading it if the module was
+        updated.
+
+        Args:
+            modulename: The name of the module.
+        Returns:
+            A ParameterSchema, or None if there is no such module.
+        """
+        with self._lock:
+            version = self.weboob_proxy.get_module_version(modulename)
+            cached = self.schemas.get(modulename)
+            if cached is None or cached[0] != version:
+                cached = self.schemas[modulename] = (
+                    version, self._load(modulename, version)
+                )
+            return cached[1]
+
+    def _load(self, modulename, version):
+        """
+        Load the schema of a module, from disk if the module did not change
+        since it was stored, from the module itself otherwise.
+
+        Args:
+            modulename: The name of the module.
+            version: The current version of the module, or None if unknown.
+        Returns:
+            A ParameterSchema, or None if there is no such module.
+        """
+        if self.cache_dir is None:
+            self.cache_dir = get_data_dir("schemas")
+        path = os.path.join(self.cache_dir, "%s.json" % modulename)
+        stored = load_json(path)
+        if version is None or stored is None or stored["version"] != version:
+            config_desc = self.weboob_proxy.get_config_desc(modulename)
+            if config_desc is None:
+                return None
+            stored = {"version": config_desc[0], "config": config_desc[1]}
+            save_json(path, stored)
+        return ParameterSchema(stored["config"])
+
+    def validate(self, konnector):
+        """
+        Validate a konnector description.
+
+        Args:
+            konnector: A konnector description dict.
+        Raises:
+            ValidationError if the konnector description is invalid.
+        """
+        if not isinstance(konnector, dict):
+            raise ValidationError("Konnector description should be a map.")
+        errors = {
+            key: "Missing key."
+            for key in ("id", "name", "parameters")
+            if key not in konnector
+        }
+        if errors:
+            raise ValidationError("Invalid konnector description.", errors)
+        if not isinstance(konnector["parameters"], dict):
+            raise ValidationError("Invalid konnector description.",
+                                  {"parameters": "Should be a map."})
+        # Only valid module names are used as file names
+        if (
+                not isinstance(konnector["name"], STRING_TYPES) or
+                not re.match(r"^[\w\-]+$", konnector["name"])
+        ):
+            raise ValidationError("Unknown module %s." % konnector["name"],
+                                  {"name": "Unknown module."})
+        schema = self.get(konnector["name"])
+        if schema is None:
+            raise ValidationError("Unknown module %s." % konnector["name"],
+                                  {"name": "Unknown module."})
+        errors = schema.validate(konnector["parameters"])
+        if errors:
+            raise ValidationError("Invalid parameters.", errors)
@@ -43,6 +43,7 @@ def dictify_config_desc(config):
             "masked": value.masked,
             "regexp": value.regexp,
             "choices": value.choices,
+            "aliases": getattr(value, "aliases", None),
             "tiny": value.tiny
         }
         for name, value in config.items()
@@ -0,0 +1,347 @@
+"""
+Work queues to distribute konnectors runs across multiple nodes.
+
+A coordinator submits batches of konnectors, split into one work item per
+konnector. Each item is assigned to a node using consistent hashing of the
+konnector id, so that a given konnector always runs on the same node as long
+as the set of live nodes does not change. Worker nodes claim the items
+assigned to them (or to nodes which are not alive anymore), run them and store
+back their results.
+
+Work queues are pluggable, see get_work_queue. The default one is based on a
+local SQLite database in WAL mode, which can be shared by nodes on the same
+host only: WAL mode does not work on network filesystems.
+"""
+import bisect
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Time after which a node which did not send any heartbeat is considered dead,
+# in seconds
+NODE_TIMEOUT = 30
+
+
+class HashRing(object):
+    """
+    Consistent hashing ring of nodes.
+    """
+    def __init__(self, nodes, replicas=64):
+        """
+        Args:
+            nodes: An iterable of node names.
+            replicas: Number of virtual nodes per node on the ring.
+        """
+        self.ring = sorted(
+            (self.hash("%s-%d" % (node, i)), node)
+            for node in nodes
+            for i in range(replicas)
+        )
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def hash(key):
+        """
+        Hash a key on the ring.
+
+        Args:
+            key: The string to hash.
+        Returns: An integer hash.
+        """
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16)
+
+    def get_node(self, key):
+        """
+        Get the node a given key is assigned to.
+
+        Args:
+            key: The key to assign, typically a konnector id.
+        Returns: The node name, or None if the ring is empty.
+        """
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.keys, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class WorkQueue(object):
+    """
+    Interface of the work queues.
+    """
+    def heartbeat(self, node):
+        """
+        Register a node as alive.
+
+        Args:
+            node: The node name.
+        """
+        raise NotImplementedError()
+
+    def live_nodes(self):
+        """
+        Get the nodes which are currently alive.
+
+        Returns: A list of node names.
+        """
+        raise NotImplementedError()
+
+    def submit(self, konnectors):
+        """
+        Submit a batch of konnectors, assigning each of them to a live node.
+
+        Args:
+            konnectors: A list of konnectors description dicts.
+        Returns: The batch id.
+        """
+        raise NotImplementedError()
+
+    def claim(self, node):
+        """
+        Claim a pending item for a given node.
+
+        Args:
+            node: The node name.
+        Returns: A tuple of the item id and the konnector description dict,
+            or None if there is no item to run.
+        """
+        raise NotImplementedError()
+
+    def release(self, node, item_id=None):
+        """
+        Requeue items claimed by a node, typically when it restarts after a
+        crash under the same name.
+
+        Args:
+            node: The node name.
+            item_id: Only requeue this item, all the items running on the
+                node if None.
+        """
+        raise NotImplementedError()
+
+    def complete(self, item_id, result):
+        """
+        Store the result of an item.
+
+        Args:
+            item_id: The item id.
+            result: The JSON string of the konnector results.
+        """
+        raise NotImplementedError()
+
+    def batch_progress(self, batch_id):
+        """
+        Count the done items of a batch, without fetching their results.
+
+        Args:
+            batch_id: The batch id.
+        Returns: A tuple of the number of done items and the total number of
+            items of the batch.
+        """
+        raise NotImplementedError()
+
+    def batch_results(self, batch_id):
+        """
+        Gather the results of the done items of a batch.
+
+        Args:
+            batch_id: The batch id.
+        Returns: A dict of the results of the done items, by konnector id.
+        """
+        raise NotImplementedError()
+
+    def delete_batch(self, batch_id):
+        """
+        Delete a batch, once its results have been gathered.
+
+        Args:
+            batch_id: The batch id.
+        """
+        raise NotImplementedError()
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Work queue stored in a SQLite database.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path: Path to the SQLite database, created if needed.
+        """
+        self.path = path
+        self._local = threading.local()
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                name TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                konnector_id TEXT,
+                konnector TEXT NOT NULL,
+                node TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                claimed_by TEXT,
+                result TEXT
+            );
+            CREATE INDEX IF NOT EXISTS items_batch ON items (batch);
+            CREATE INDEX IF NOT EXISTS items_status ON items (status);
+        """)
+
+    def connection(self):
+        """
+        Get the SQLite connection of the current thread.
+
+        Returns: A sqlite3 connection, in autocommit mode.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def heartbeat(self, node):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO nodes (name, heartbeat) VALUES (?, ?)",
+            (node, time.time())
+        )
+
+    def live_nodes(self):
+        return [
+            row[0] for row in self.connection().execute(
+                "SELECT name FROM nodes WHERE heartbeat > ? ORDER BY name",
+                (time.time() - NODE_TIMEOUT,)
+            )
+        ]
+
+    def submit(self, konnectors):
+        batch_id = uuid.uuid4().hex
+        ring = HashRing(self.live_nodes())
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO items (batch, konnector_id, konnector, node) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        batch_id,
+                        konnector.get("id"),
+                        json.dumps(konnector),
+                        ring.get_node(u"%s" % konnector.get("id"))
+                    )
+                    for konnector in konnectors
+                ]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return batch_id
+
+    def claim(self, node):
+        connection = self.connection()
+        dead_line = time.time() - NODE_TIMEOUT
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Requeue items whose node died while running them
+            connection.execute(
+                "UPDATE items SET status = 'pending', claimed_by = NULL "
+                "WHERE status = 'running' AND claimed_by NOT IN ("
+                "    SELECT name FROM nodes WHERE heartbeat > ?"
+                ")",
+                (dead_line,)
+            )
+            # Items assigned to this node come first, then the ones of dead
+            # or unknown nodes
+            row = connection.execute(
+                "SELECT id, konnector FROM items "
+                "WHERE status = 'pending' AND ("
+                "    node = ? OR node IS NULL OR node NOT IN ("
+                "        SELECT name FROM nodes WHERE heartbeat > ?"
+                "    )"
+                ") ORDER BY node = ? DESC, id LIMIT 1",
+                (node, dead_line, node)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE items SET status = 'running', claimed_by = ? "
+                    "WHERE id = ?",
+                    (node, row[0])
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def release(self, node, item_id=None):
+        query = (
+            "UPDATE items SET status = 'pending', claimed_by = NULL "
+            "WHERE status = 'running' AND claimed_by = ?"
+        )
+        params = (node,)
+        if item_id is not None:
+            query += " AND id = ?"
+            params += (item_id,)
+        self.connection().execute(query, params)
+
+    def complete(self, item_id, result):
+        self.connection().execute(
+            "UPDATE items SET status = 'done', result = ? WHERE id = ?",
+            (result, item_id)
+        )
+
+    def batch_progress(self, batch_id):
+        done, total = self.connection().execute(
+            "SELECT SUM(status = 'done'), COUNT(*) FROM items WHERE batch = ?",
+            (batch_id,)
+        ).fetchone()
+        return done or 0, total
+
+    def batch_results(self, batch_id):
+        results = {}
+        for row in self.connection().execute(
+                "SELECT result FROM items WHERE batch = ? AND status = 'done'",
+                (batch_id,)
+        ):
+            results.update(json.loads(row[0]))
+        return results
+
+    def delete_batch(self, batch_id):
+        self.connection().execute("DELETE FROM items WHERE batch = ?",
+                                  (batch_id,))
+
+
+# Available work queues, by URL scheme
+WORK_QUEUES = {
+    "sqlite": SQLiteWorkQueue
+}
+
+
+def get_work_queue(url):
+    """
+    Build a work queue from its URL, such as sqlite:///path/to/queue.db. A
+    plain path is considered to be a SQLite database.
+
+    Args:
+        url: The work queue URL.
+    Returns: A WorkQueue.
+    """
+    if "://" not in url:
+        return SQLiteWorkQueue(url)
+    scheme, location = url.split("://", 1)
+    try:
+        return WORK_QUEUES[scheme](location)
+    except KeyError:
+        raise ValueError("Unknown work queue: %s." % url)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+"""
+Local stand-in website for load testing, serving the data of the fake
+`fakesite` Weboob module (see the `modules` folder).
+
+It serves fake subscriptions, documents, history and details as JSON, and
+fake PDF files. Sizes and latency are configurable, see FakeSite.
+"""
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+# Password always refused by the fake site, to test failing logins
+WRONG_PASSWORD = "wrong"
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the fake site.
+    """
+    def log_message(self, *args):
+        """
+        Do not log requests.
+        """
+        pass
+
+    def send_body(self, body, content_type="application/json", status=200,
+                  headers=None):
+        """
+        Send a response.
+
+        Args:
+            body: The response body bytes.
+            content_type: The response content type.
+            status: The response status code.
+            headers: An optional dict of extra headers.
+        """
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj):
+        """
+        Send a JSON response.
+
+        Args:
+            obj: The JSON-serializable object to send.
+        """
+        self.send_body(json.dumps(obj).encode("utf-8"))
+
+    def is_logged(self):
+        """
+        Check the session cookie.
+
+        Returns: true / false
+        """
+        return "session=ok" in self.headers.get("Cookie", "")
+
+    def do_POST(self):
+        """
+        Handle POST requests, only used to login.
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if urlparse(self.path).path != "/login":
+            self.send_body(b"Not found", "text/plain", 404)
+        elif form.get("password", [""])[0] == WRONG_PASSWORD:
+            self.send_body(b"Wrong password", "text/plain", 403)
+        else:
+            self.send_body(b"{}",
+                           headers={"Set-Cookie": "session=ok; Path=/"})
+
+    def do_GET(self):
+        """
+        Handle GET requests.
+        """
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if not self.is_logged():
+            self.send_body(b"Forbidden", "text/plain", 403)
+        elif parts == ["api", "subscriptions"]:
+            self.send_json([
+                {"id": "sub%d" % i, "label": "Line %d" % i}
+                for i in range(self.server.subscriptions)
+            ])
+        elif parts[:2] == ["api", "documents"] and len(parts) == 3:
+            self.send_json([
+                {
+                    "id": "%s-bill%d" % (parts[2], i),
+                    "date": "2016-%02d-01" % (1 + i % 12),
+                    "price": "%d.%02d" % (20 + i % 30, i % 100),
+                    "label": "Bill %d" % i,
+                    "url": "/files/%s-bill%d.pdf" % (parts[2], i)
+                }
+                for i in range(self.server.documents)
+            ])
+        elif parts[:2] == ["api", "history"] and len(parts) == 3:
+            self.send_json([
+                {
+                    "id": "%s-call%d" % (parts[2], i),
+                    "datetime": "2016-%02d-%02dT12:%02d:00" % (
+                        1 + i % 12, 1 + i % 28, i % 60
+                    ),
+                    "price": "0.%02d" % (i % 100),
+                    "label": "Call to 06%08d" % (i % 1000),
+                    "quantity": i % 600
+                }
+                for i in range(self.server.history)
+            ])
+        elif parts[:2] == ["api", "details"] and len(parts) == 3:
+            self.send_json([
+                {"label": label, "price": "%d.00" % i, "quantity": 10 * i}
+                for i, label in enumerate(("Voice", "SMS", "Data"))
+            ])
+        elif parts[0] == "files" and len(parts) == 2:
+            self.send_body(b"%PDF-1.4 fake " + parts[1].encode("utf-8"),
+                           "application/pdf")
+        else:
+            self.send_body(b"Not found", "text/plain", 404)
+
+
+class FakeSite(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server for the fake site.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, subscriptions=1, documents=12, history=1000,
+                 latency=0.0):
+        """
+        Args:
+            address: A (host, port) tuple to listen on.
+            subscriptions: Number of subscriptions of any account.
+            documents: Number of documents of any subscription.
+            history: Number of history items of any subscription.
+            latency: Delay, in seconds, added to any response.
+        """
+        HTTPServer.__init__(self, address, FakeSiteHandler)
+        self.subscriptions = subscriptions
+        self.documents = documents
+        self.history = history
+        self.latency = latency
+
+    @property
+    def url(self):
+        """
+        Base URL of the fake site.
+        """
+        return "http://%s:%d/" % self.server_address[:2]
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+if __name__ == "__main__":
+    SITE = FakeSite(("localhost", int(os.environ.get("FAKESITE_PORT", 8081))))
+    print("Serving fake site on %s" % SITE.url)
+    SITE.serve_forever()
@@ -0,0 +1,4 @@
+from .module import FakesiteModule
+
+
+__all__ = ['FakesiteModule']
@@ -0,0 +1,75 @@
+"""
+Browser of the fake site used for load testing.
+"""
+import os
+
+from datetime import datetime
+from decimal import Decimal
+
+from weboob.browser import LoginBrowser, need_login
+from weboob.browser.exceptions import ClientError
+from weboob.capabilities.bill import Bill, Detail, Subscription
+from weboob.exceptions import BrowserIncorrectPassword
+
+
+class FakesiteBrowser(LoginBrowser):
+    BASEURL = os.environ.get("FAKESITE_URL", "http://localhost:8081/")
+
+    def __init__(self, *args, **kwargs):
+        super(FakesiteBrowser, self).__init__(*args, **kwargs)
+        self.logged = False
+
+    def do_login(self):
+        try:
+            self.open("/login", data={"login": self.username,
+                                      "password": self.password})
+        except ClientError:
+            raise BrowserIncorrectPassword()
+        self.logged = True
+
+    @need_login
+    def iter_subscription(self):
+        for item in self.open("/api/subscriptions").json():
+            subscription = Subscription(item["id"])
+            subscription.label = item["label"]
+            subscription.subscriber = self.username
+            yield subscription
+
+    @need_login
+    def iter_documents(self, subscription):
+        for item in self.open("/api/documents/%s" % subscription.id).json():
+            bill = Bill(item["id"], url=item["url"])
+            bill.date = datetime.strptime(item["date"], "%Y-%m-%d").date()
+            bill.price = Decimal(item["price"])
+            bill.currency = u"EUR"
+            bill.label = item["label"]
+            bill.format = u"pdf"
+            bill.type = u"bill"
+            yield bill
+
+    @need_login
+    def iter_history(self, subscription):
+        for item in self.open("/api/history/%s" % subscription.id).json():
+            detail = Detail(item["id"])
+            detail.datetime = datetime.strptime(item["datetime"],
+                                                "%Y-%m-%dT%H:%M:%S")
+            detail.price = Decimal(item["price"])
+            detail.currency = u"EUR"
+            detail.label = item["label"]
+            detail.quantity = Decimal(item["quantity"])
+            detail.unit = u"s"
+            yield detail
+
+    @need_login
+    def iter_details(self, subscription):
+        for item in self.open("/api/details/%s" % subscription.id).json():
+            detail = Detail()
+            detail.price = Decimal(item["price"])
+            detail.currency = u"EUR"
+            detail.label = item["label"]
+            detail.quantity = Decimal(item["quantity"])
+            yield detail
+
+    @need_login
+    def download(self, url):
+        return self.open(url).content
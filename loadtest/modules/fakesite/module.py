@@ -0,0 +1,68 @@
+"""
+Fake Weboob module, browsing the local fake site used for load testing.
+"""
+from weboob.capabilities.base import find_object
+from weboob.capabilities.bill import (CapDocument, Document, DocumentNotFound,
+                                      Subscription, SubscriptionNotFound)
+from weboob.core import Weboob
+from weboob.tools.backend import BackendConfig, Module
+from weboob.tools.value import Value, ValueBackendPassword
+
+from .browser import FakesiteBrowser
+
+
+__all__ = ['FakesiteModule']
+
+
+class FakesiteModule(Module, CapDocument):
+    NAME = 'fakesite'
+    DESCRIPTION = u'Fake website, for cozyweboob load testing'
+    MAINTAINER = u'cozyweboob'
+    EMAIL = 'cozyweboob@example.com'
+    LICENSE = 'MIT'
+    VERSION = Weboob.VERSION
+
+    BROWSER = FakesiteBrowser
+
+    CONFIG = BackendConfig(
+        Value('login', label='Login', regexp=r'^[\w\-]+$'),
+        ValueBackendPassword('password', label='Password')
+    )
+
+    def create_default_browser(self):
+        return self.create_browser(self.config['login'].get(),
+                                   self.config['password'].get())
+
+    def iter_subscription(self):
+        return self.browser.iter_subscription()
+
+    def get_subscription(self, _id):
+        return find_object(self.iter_subscription(), id=_id,
+                           error=SubscriptionNotFound)
+
+    def iter_documents(self, subscription):
+        if not isinstance(subscription, Subscription):
+            subscription = self.get_subscription(subscription)
+        return self.browser.iter_documents(subscription)
+
+    def get_document(self, _id):
+        for subscription in self.iter_subscription():
+            for document in self.iter_documents(subscription):
+                if document.id == _id or document.fullid == _id:
+                    return document
+        raise DocumentNotFound()
+
+    def iter_documents_history(self, subscription):
+        if not isinstance(subscription, Subscription):
+            subscription = self.get_subscription(subscription)
+        return self.browser.iter_history(subscription)
+
+    def get_details(self, subscription):
+        if not isinstance(subscription, Subscription):
+            subscription = self.get_subscription(subscription)
+        return self.browser.iter_details(subscription)
+
+    def download_document(self, document):
+        if not isinstance(document, Document):
+            document = self.get_document(document)
+        return self.browser.download(document.url)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python2
+"""
+HTTP load testing harness for server.py.
+
+It starts the local fake site and a server.py instance using the fake
+`fakesite` Weboob module only, replays a mix of `/fetch`, `/list` and
+`/retrieve` requests at a target rate, and writes a JSON report with latency
+percentiles, error rate, throughput and server RSS over time.
+
+Typical usage, from the root of the repository:
+    python loadtest/run.py --rate 5 --duration 60 --output report.json
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import queue
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode
+    from urllib.request import Request, urlopen
+except ImportError:  # Python 2
+    import Queue as queue
+    from urllib import urlencode
+    from urllib2 import HTTPError, Request, urlopen
+
+from fakesite import FakeSite
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "modules")
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=5,
+                        help="Target number of requests per second.")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="Duration of the test, in seconds.")
+    parser.add_argument("--mix", default="fetch=8,list=1,retrieve=1",
+                        help="Weights of each kind of request.")
+    parser.add_argument("--konnectors", type=int, default=1,
+                        help="Number of konnectors per /fetch request.")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="Maximum number of requests in flight.")
+    parser.add_argument("--documents", type=int, default=12,
+                        help="Number of documents per fake subscription.")
+    parser.add_argument("--history", type=int, default=1000,
+                        help="Number of history items per fake subscription.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Latency of the fake site, in seconds.")
+    parser.add_argument("--error-ratio", type=float, default=0.0,
+                        help="Ratio of konnectors with a wrong password.")
+    parser.add_argument("--port", type=int, default=18080,
+                        help="Port for the server under test.")
+    parser.add_argument("--server-env", action="append", default=[],
+                        metavar="KEY=VALUE",
+                        help="Extra environment variable for the server.")
+    parser.add_argument("--output", default=None,
+                        help="Path of the JSON report, stdout if not set.")
+    return parser.parse_args()
+
+
+def process_tree_rss(pid):
+    """
+    Get the total RSS of a process and all its descendants (typically worker
+    processes).
+
+    Args:
+        pid: The root process id.
+    Returns: The total RSS in bytes, or None if unavailable.
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as stat:
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open("/proc/%d/status" % current) as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except (IOError, OSError):
+            continue
+    return total or None
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values: A sorted list of values.
+        fraction: The percentile, between 0 and 1.
+    Returns: The percentile value, or None if there are no values.
+    """
+    if not values:
+        return None
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def latency_stats(latencies):
+    """
+    Summarize a list of latencies.
+
+    Args:
+        latencies: A list of latencies in seconds.
+    Returns: A dict of statistics, in milliseconds.
+    """
+    latencies = sorted(latencies)
+    stats = {
+        "count": len(latencies),
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else None,
+        "mean": sum(latencies) / len(latencies) if latencies else None
+    }
+    return {
+        key: value * 1000 if key != "count" and value is not None else value
+        for key, value in stats.items()
+    }
+
+
+class LoadTest(object):
+    """
+    A load test run against a server.py instance.
+    """
+    def __init__(self, args):
+        """
+        Args:
+            args: The parsed command-line arguments.
+        """
+        self.args = args
+        self.base_url = "http://localhost:%d" % args.port
+        self.mix = []
+        for item in args.mix.split(","):
+            kind, weight = item.split("=")
+            self.mix.append((kind.strip(), float(weight)))
+        self.results = []
+        self.results_lock = threading.Lock()
+        self.rss = []
+        self.retrieve_path = None
+        self.tmp_dir = tempfile.mkdtemp(prefix="cozyweboob-loadtest-")
+        self.site = None
+        self.server = None
+
+    def start(self):
+        """
+        Start the fake site and the server under test.
+        """
+        self.site = FakeSite(("localhost", 0),
+                             documents=self.args.documents,
+                             history=self.args.history,
+                             latency=self.args.latency)
+        self.site.start()
+        # Use a dedicated Weboob workdir, with the fake modules only
+        workdir = os.path.join(self.tmp_dir, "weboob")
+        os.makedirs(workdir)
+        with open(os.path.join(workdir, "sources.list"), "w") as sources:
+            sources.write("file://%s\n" % MODULES_DIR)
+        env = dict(os.environ)
+        # Downloaded files end up in the server temp dir, keep it apart
+        server_tmp_dir = os.path.join(self.tmp_dir, "tmp")
+        os.makedirs(server_tmp_dir)
+        env.update({
+            "TMPDIR": server_tmp_dir,
+            "WEBOOB_WORKDIR": workdir,
+            "COZYWEBOOB_DATA_DIR": os.path.join(self.tmp_dir, "data"),
+            "COZYWEBOOB_HOST": "localhost",
+            "COZYWEBOOB_PORT": str(self.args.port),
+            "FAKESITE_URL": self.site.url,
+            "PYTHONPATH": os.pathsep.join(
+                [ROOT_DIR] + [x for x in [env.get("PYTHONPATH")] if x]
+            )
+        })
+        for item in self.args.server_env:
+            key, value = item.split("=", 1)
+            env[key] = value
+        self.server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT_DIR, "server.py")],
+            env=env,
+            stdout=open(os.path.join(self.tmp_dir, "server.log"), "w"),
+            stderr=subprocess.STDOUT
+        )
+        # Wait for the server to be up
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            if self.server.poll() is not None:
+                raise RuntimeError("Server exited, see %s." % (
+                    os.path.join(self.tmp_dir, "server.log"),
+                ))
+            try:
+                urlopen(self.base_url + "/list", timeout=5).read()
+                return
+            except (IOError, OSError):
+                time.sleep(0.5)
+        raise RuntimeError("Server did not start in time.")
+
+    def stop(self):
+        """
+        Stop the server and the fake site, and clean temporary files.
+        """
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+        if self.site is not None:
+            self.site.shutdown()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def konnectors(self, download=False, error_ratio=None):
+        """
+        Build a list of konnectors for a /fetch request.
+
+        Args:
+            download: Whether to download documents.
+            error_ratio: Ratio of konnectors with a wrong password, defaults
+                to the --error-ratio argument.
+        Returns: A list of konnectors description dicts.
+        """
+        if error_ratio is None:
+            error_ratio = self.args.error_ratio
+        return [
+            {
+                "id": "load-%d" % random.randint(0, 10 ** 9),
+                "name": "fakesite",
+                "parameters": {
+                    "login": "user%d" % random.randint(0, 1000),
+                    "password": (
+                        "wrong"
+                        if random.random() < error_ratio
+                        else "secret"
+                    )
+                },
+                "actions": {"fetch": True, "download": download}
+            }
+            for _ in range(self.args.konnectors)
+        ]
+
+    def prepare_retrieve(self):
+        """
+        Download a document through the server, to have a file to retrieve.
+        """
+        body = json.dumps(
+            self.konnectors(download=True, error_ratio=0)
+        ).encode("utf-8")
+        output = json.loads(urlopen(Request(self.base_url + "/fetch",
+                                            data=body)).read().decode("utf-8"))
+        for result in output.values():
+            for path in (result.get("downloaded") or {}).values():
+                if path:
+                    self.retrieve_path = path
+                    return
+
+    def request(self, kind):
+        """
+        Send a single request.
+
+        Args:
+            kind: The kind of request, "fetch", "list" or "retrieve".
+        Returns: A tuple of the HTTP status code and whether it failed.
+        """
+        if kind == "fetch":
+            request = Request(
+                self.base_url + "/fetch",
+                data=json.dumps(self.konnectors()).encode("utf-8")
+            )
+        elif kind == "list":
+            request = Request(self.base_url + "/list")
+        elif kind == "retrieve":
+            request = Request(
+                self.base_url + "/retrieve",
+                data=urlencode({"path": self.retrieve_path}).encode("utf-8")
+            )
+        else:
+            raise ValueError("Unknown request kind %s." % kind)
+        try:
+            response = urlopen(request, timeout=300)
+            body = response.read()
+            status = response.getcode()
+        except HTTPError as exception:
+            return exception.code, True
+        except (IOError, OSError):
+            return None, True
+        failed = False
+        if kind == "fetch":
+            # Konnectors errors are reported in the response body
+            output = json.loads(body.decode("utf-8"))
+            failed = any("error" in result for result in output.values())
+        return status, failed
+
+    def pick_kind(self):
+        """
+        Pick a kind of request according to the mix weights.
+
+        Returns: The kind of request.
+        """
+        choice = random.uniform(0, sum(weight for _, weight in self.mix))
+        for kind, weight in self.mix:
+            choice -= weight
+            if choice <= 0:
+                return kind
+        return self.mix[-1][0]
+
+    def worker(self, pending):
+        """
+        Send the pending requests, recording their results.
+
+        Args:
+            pending: A queue of (kind, scheduled time) tuples, None to stop.
+        """
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            kind, scheduled = item
+            started = time.time()
+            status, failed = self.request(kind)
+            ended = time.time()
+            with self.results_lock:
+                self.results.append({
+                    "kind": kind,
+                    "scheduled": scheduled,
+                    "started": started,
+                    # Measured from the scheduled time, so that the client
+                    # falling behind is accounted for in latencies.
+                    "latency": ended - scheduled,
+                    "status": status,
+                    "failed": failed
+                })
+
+    def sample_rss(self, stop, start_time):
+        """
+        Sample the RSS of the server every second.
+
+        Args:
+            stop: A threading.Event to stop sampling.
+            start_time: Start time of the test.
+        """
+        while not stop.is_set():
+            self.rss.append([round(time.time() - start_time, 1),
+                             process_tree_rss(self.server.pid)])
+            stop.wait(1)
+
+    def run(self):
+        """
+        Run the load test.
+
+        Returns: The JSON-serializable report.
+        """
+        if any(kind == "retrieve" for kind, _ in self.mix):
+            self.prepare_retrieve()
+        pending = queue.Queue()
+        workers = [
+            threading.Thread(target=self.worker, args=(pending,))
+            for _ in range(self.args.concurrency)
+        ]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+        stop = threading.Event()
+        start_time = time.time()
+        sampler = threading.Thread(target=self.sample_rss,
+                                   args=(stop, start_time))
+        sampler.daemon = True
+        sampler.start()
+        # Open loop: requests are scheduled at a fixed rate, whatever the
+        # response times.
+        total = int(self.args.rate * self.args.duration)
+        for i in range(total):
+            scheduled = start_time + i / self.args.rate
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pending.put((self.pick_kind(), scheduled))
+        for _ in workers:
+            pending.put(None)
+        for thread in workers:
+            thread.join()
+        elapsed = time.time() - start_time
+        stop.set()
+        sampler.join()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        """
+        Build the report of the run.
+
+        Args:
+            elapsed: Total duration of the run, in seconds.
+        Returns: The JSON-serializable report.
+        """
+        kinds = sorted(set(result["kind"] for result in self.results))
+        errors = sum(1 for result in self.results if result["failed"])
+        status_codes = {}
+        for result in self.results:
+            key = str(result["status"])
+            status_codes[key] = status_codes.get(key, 0) + 1
+        return {
+            "config": {
+                key: value for key, value in vars(self.args).items()
+                if key != "output"
+            },
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "elapsed": elapsed,
+            "requests": len(self.results),
+            "errors": errors,
+            "error_rate": (
+                float(errors) / len(self.results) if self.results else None
+            ),
+            "throughput": len(self.results) / elapsed,
+            "status_codes": status_codes,
+            "latency_ms": dict(
+                [("all", latency_stats([x["latency"]
+                                        for x in self.results]))] +
+                [
+                    (kind, latency_stats([x["latency"] for x in self.results
+                                          if x["kind"] == kind]))
+                    for kind in kinds
+                ]
+            ),
+            "server_rss": self.rss
+        }
+
+
+def main():
+    """
+    Main function
+    """
+    args = parse_args()
+    load_test = LoadTest(args)
+    try:
+        load_test.start()
+        report = json.dumps(load_test.run(), indent=4, sort_keys=True)
+    finally:
+        load_test.stop()
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python2
+"""
+Scheduler daemon, periodically running konnectors
+"""
+import json
+import logging
+import os
+import sys
+
+from cozyweboob import Coordinator
+from cozyweboob import main_fetch
+from cozyweboob import Scheduler
+from cozyweboob import WeboobProxy
+from cozyweboob import WorkerPool
+from cozyweboob.tools.env import get_int_env, is_in_debug_mode
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """
+    Main function
+    """
+    # Debug only: Set logging level and format
+    if is_in_debug_mode():
+        logging.basicConfig(
+            format='%(levelname)s: %(message)s',
+            level=logging.INFO
+        )
+    else:
+        logging.basicConfig(
+            format='%(levelname)s: %(message)s',
+            level=logging.ERROR
+        )
+    if len(sys.argv) < 2:
+        sys.exit("Usage: %s KONNECTORS_JSON_FILE" % sys.argv[0])
+    try:
+        with open(sys.argv[1]) as konnectors_file:
+            konnectors = json.load(konnectors_file)
+    except (IOError, ValueError):
+        logger.error("Invalid konnectors file.")
+        sys.exit(-1)
+    # Ensure all modules are installed and up to date before starting the
+    # scheduler
+    logger.info("Ensuring all modules are installed and up to date.")
+    proxy = WeboobProxy()
+    proxy.install_modules()
+    # Start the worker processes pool, if enabled
+    fetcher = main_fetch
+    if os.environ.get("COZYWEBOOB_QUEUE"):
+        logger.info("Dispatching konnectors to worker nodes.")
+        fetcher = Coordinator().main_fetch
+    elif get_int_env("COZYWEBOOB_WORKERS", 0) > 0:
+        logger.info("Starting worker processes.")
+        fetcher = WorkerPool().main_fetch
+    scheduler = Scheduler(
+        konnectors,
+        fetcher=fetcher,
+        max_concurrency=get_int_env("COZYWEBOOB_SCHEDULER_CONCURRENCY", 4),
+        max_module_concurrency=get_int_env(
+            "COZYWEBOOB_SCHEDULER_MODULE_CONCURRENCY", 1
+        ),
+        jitter=get_int_env("COZYWEBOOB_SCHEDULER_JITTER", 10) / 100.0
+    )
+    logger.info("Starting scheduler.")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,29 +2,177 @@
 """
 HTTP server wrapper around weboob
 """
+import collections
+import hashlib
 import logging
 import os
 import tempfile
 
-from bottle import post, request, route, run, static_file
+from wsgiref.simple_server import (WSGIRequestHandler, WSGIServer,
+                                   make_server)
+
+try:
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from SocketServer import ThreadingMixIn
+
+from bottle import (ServerAdapter, post, request, response, route, run,
+                    static_file)
 
 from cozyweboob import main as cozyweboob
 from cozyweboob import clean
+from cozyweboob import Coordinator
+from cozyweboob import main_fetch
 from cozyweboob import WeboobProxy
-from cozyweboob.tools.env import is_in_debug_mode
+from cozyweboob import WorkerPool
+from cozyweboob.__main__ import BREAKERS
+from cozyweboob.tools.env import get_int_env, is_in_debug_mode
+from cozyweboob.tools.fair_queue import (BULK, INTERACTIVE, PRIORITIES,
+                                         BatchTooLargeError, FairScheduler,
+                                         QueueFullError, parse_weights)
+from cozyweboob.tools.http import accepts_encoding, gzip_compress
 from cozyweboob.tools.jsonwriter import pretty_json
+from cozyweboob.tools.spill import DEFAULT_PAGE_LIMIT, read_page
 
 # Module specific logger
 logger = logging.getLogger(__name__)
 
+# Konnectors fetching function, replaced by a worker pool one if enabled
+FETCHER = main_fetch
+# Fair-share scheduler of the konnectors runs, built by init
+SCHEDULER = None
+# Default number of konnectors dispatched concurrently to worker nodes
+COORDINATOR_CONCURRENCY = 16
+
+
+class ThreadingWSGIRefServer(ServerAdapter):
+    """
+    Bottle server adapter handling each request in its own thread, so that
+    requests can wait in the scheduler queues concurrently.
+    """
+    def run(self, app):
+        class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+
+        class RequestHandler(WSGIRequestHandler):
+            def log_request(*args, **kwargs):
+                if not self.quiet:
+                    return WSGIRequestHandler.log_request(*args, **kwargs)
+
+        server = make_server(self.host, self.port, app,
+                             ThreadingWSGIServer, RequestHandler)
+        server.serve_forever()
+
+
+def run_konnector(konnector):
+    """
+    Run a single konnector, called by the scheduler.
+
+    Args:
+        konnector: A konnector description dict.
+    Returns: A dict of results, as returned by main_fetch.
+    """
+    return FETCHER([konnector])
+
+
+def get_tenant():
+    """
+    Identify the tenant of the current request, from the
+    X-Cozyweboob-Tenant header or from the bearer token.
+
+    Returns: The tenant name.
+    """
+    tenant = request.headers.get("X-Cozyweboob-Tenant")
+    if tenant:
+        return tenant
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        # Do not keep tokens around
+        return "token-%s" % hashlib.sha1(
+            authorization[len("Bearer "):].strip().encode("utf-8")
+        ).hexdigest()[:12]
+    return "default"
+
+
+def encode_response(body):
+    """
+    Gzip compress a response body if the client accepts it.
+
+    Args:
+        body: The response body string.
+    Returns:
+        the response body to send.
+    """
+    response.add_header("Vary", "Accept-Encoding")
+    if accepts_encoding(request.headers.get("Accept-Encoding"), "gzip"):
+        response.set_header("Content-Encoding", "gzip")
+        return gzip_compress(body.encode("utf-8"))
+    return body
+
 
 @post("/fetch")
 def fetch_view():
     """
     Fetch from weboob modules.
     """
+    tenant = get_tenant()
+    priority = request.headers.get("X-Cozyweboob-Priority")
+    if priority is not None and priority not in PRIORITIES:
+        response.status = 400
+        return pretty_json({
+            "error": "Unknown priority class: %s." % priority
+        })
+    queue_delays = []
+
+    def fetcher(konnectors):
+        """
+        Fetch konnectors through the scheduler queues. Single konnectors are
+        interactive by default, batches are bulk.
+        """
+        if priority is None:
+            konnectors_priority = INTERACTIVE if len(konnectors) == 1 else BULK
+        else:
+            konnectors_priority = priority
+        results, queue_delay = SCHEDULER.map(tenant, konnectors_priority,
+                                             konnectors)
+        queue_delays.append(queue_delay)
+        fetched_data = collections.defaultdict(dict)
+        for result in results:
+            for konnector_id, data in result.items():
+                fetched_data[konnector_id].update(data)
+        return fetched_data
+
     params = request.body.read()
-    return pretty_json(cozyweboob(params))
+    try:
+        fetched_data = cozyweboob(params, fetcher=fetcher)
+    except BatchTooLargeError as exception:
+        # Retrying would not help
+        response.status = 413
+        return pretty_json({"error": exception})
+    except QueueFullError as exception:
+        logger.error("Rejecting fetch: %s", exception)
+        response.status = 503
+        response.set_header("Retry-After", str(exception.retry_after))
+        return pretty_json({"error": exception})
+    response.set_header("X-Cozyweboob-Queue-Delay",
+                        "%.3f" % max(queue_delays or [0]))
+    return encode_response(pretty_json(fetched_data))
+
+
+@post("/page")
+def page_view():
+    """
+    Page through a result section previously spilled to disk.
+    """
+    try:
+        return encode_response(pretty_json(read_page(
+            request.forms.get("cursor", ""),
+            offset=request.forms.get("offset", 0),
+            limit=request.forms.get("limit", DEFAULT_PAGE_LIMIT)
+        )))
+    except ValueError as exception:
+        response.status = 400
+        return pretty_json({"error": exception})
 
 
 @post("/retrieve")
@@ -37,7 +185,7 @@ def retrieve_view():
     default directory.
     """
     path = request.forms.get("path")
-    return static_file(path.replace(tempfile.gettempdir(), './'),
+    return static_file(os.path.relpath(path, tempfile.gettempdir()),
                        tempfile.gettempdir(),
                        download=True)
 
@@ -57,13 +205,30 @@ def list_view():
     List all available weboob modules and their configuration options.
     """
     proxy = WeboobProxy()
-    return pretty_json(proxy.list_modules())
+    return encode_response(pretty_json(proxy.list_modules()))
+
+
+@route("/breakers")
+def breakers_view():
+    """
+    List the circuit breakers states of the modules.
+    """
+    return pretty_json(BREAKERS.states())
+
+
+@route("/queues")
+def queues_view():
+    """
+    List the states of the scheduler queues.
+    """
+    return pretty_json(SCHEDULER.stats())
 
 
 def init():
     """
     Init function
     """
+    global FETCHER, SCHEDULER
     # Debug only: Set logging level and format
     if is_in_debug_mode():
         logging.basicConfig(
@@ -80,6 +245,24 @@ def init():
     logger.info("Ensuring all modules are installed and up to date.")
     proxy = WeboobProxy()
     proxy.install_modules()
+    # Start the worker processes pool, if enabled
+    concurrency = 1
+    if os.environ.get("COZYWEBOOB_QUEUE"):
+        logger.info("Dispatching konnectors to worker nodes.")
+        FETCHER = Coordinator().main_fetch
+        # Konnectors wait for worker nodes, the cluster sets the pace
+        concurrency = COORDINATOR_CONCURRENCY
+    elif get_int_env("COZYWEBOOB_WORKERS", 0) > 0:
+        logger.info("Starting worker processes.")
+        pool = WorkerPool()
+        FETCHER = pool.main_fetch
+        concurrency = pool.size
+    SCHEDULER = FairScheduler(
+        run_konnector,
+        concurrency=get_int_env("COZYWEBOOB_FETCH_CONCURRENCY", concurrency),
+        max_depth=get_int_env("COZYWEBOOB_TENANT_MAX_QUEUE", 1000),
+        weights=parse_weights(os.environ.get("COZYWEBOOB_TENANT_WEIGHTS"))
+    )
     logger.info("Starting server.")
 
 
@@ -91,7 +274,8 @@ def main():
     # Get host to listen on
     HOST = os.environ.get("COZYWEBOOB_HOST", "localhost")
     PORT = os.environ.get("COZYWEBOOB_PORT", 8080)
-    run(host=HOST, port=PORT, debug=is_in_debug_mode())
+    run(server=ThreadingWSGIRefServer, host=HOST, port=PORT,
+        debug=is_in_debug_mode())
 
 
 if __name__ == "__main__":
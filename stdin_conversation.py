@@ -5,24 +5,53 @@ the
 [Python-shell](https://github.com/Birch-san/python-shell/blob/9d8641dc1e55e808ba82d029f9920413ab63206f/test/python/conversation.py)
 conversation example.
 """
+import json
 import logging
+import os
 import sys
 
 from cozyweboob import main as cozyweboob
 from cozyweboob import clean
+from cozyweboob import Coordinator
+from cozyweboob import main_fetch
 from cozyweboob import WeboobProxy
-from cozyweboob.tools.env import is_in_debug_mode
+from cozyweboob import WorkerPool
+from cozyweboob.__main__ import BREAKERS
+from cozyweboob.tools.env import get_int_env, is_in_debug_mode
 from cozyweboob.tools.jsonwriter import json_dump
+from cozyweboob.tools.spill import DEFAULT_PAGE_LIMIT, read_page
 
 # Module specific logger
 logger = logging.getLogger(__name__)
 
+# Konnectors fetching function, replaced by a worker pool one if enabled
+FETCHER = main_fetch
+
 
 def fetch_view(params):
     """
     Fetch from weboob modules.
     """
-    return json_dump(cozyweboob(params))
+    return json_dump(cozyweboob(params, fetcher=FETCHER))
+
+
+def page_view(params):
+    """
+    Page through a result section previously spilled to disk.
+    """
+    try:
+        params = json.loads(params)
+        if not isinstance(params, dict):
+            raise ValueError("Page parameters should be a JSON map.")
+        return json_dump(read_page(
+            params.get("cursor", ""),
+            offset=params.get("offset", 0),
+            limit=params.get("limit", DEFAULT_PAGE_LIMIT)
+        ))
+    except (TypeError, ValueError) as exception:
+        # TypeError is raised for values of the wrong type, such as a list
+        # offset
+        return json_dump({"error": exception})
 
 
 def list_view():
@@ -33,6 +62,13 @@ def list_view():
     return json_dump(proxy.list_modules())
 
 
+def breakers_view():
+    """
+    List the circuit breakers states of the modules.
+    """
+    return json_dump(BREAKERS.states())
+
+
 def clean_view():
     """
     Clean temporary downloaded files.
@@ -58,6 +94,10 @@ def process_query(query):
         # List modules view
         logger.info("Calling /list view.")
         return list_view()
+    elif query == "GET /breakers":
+        # Circuit breakers view
+        logger.info("Calling /breakers view.")
+        return breakers_view()
     elif query == "POST /clean":
         # Clean view
         logger.info("Calling /clean view")
@@ -67,6 +107,11 @@ def process_query(query):
         logger.info("Calling /fetch view.")
         params = query.split()[2]
         return fetch_view(params)
+    elif query.startswith("POST /page"):
+        # Page through spilled results view
+        logger.info("Calling /page view.")
+        params = query.split()[2]
+        return page_view(params)
     elif query == "exit":
         # Exit command
         logger.info("Exiting.")
@@ -81,6 +126,7 @@ def main():
     """
     Main function
     """
+    global FETCHER
     # Debug only: Set logging level and format
     if is_in_debug_mode():
         logging.basicConfig(
@@ -97,6 +143,13 @@ def main():
     logger.info("Ensuring all modules are installed and up to date.")
     proxy = WeboobProxy()
     proxy.install_modules()
+    # Start the worker processes pool, if enabled
+    if os.environ.get("COZYWEBOOB_QUEUE"):
+        logger.info("Dispatching konnectors to worker nodes.")
+        FETCHER = Coordinator().main_fetch
+    elif get_int_env("COZYWEBOOB_WORKERS", 0) > 0:
+        logger.info("Starting worker processes.")
+        FETCHER = WorkerPool().main_fetch
     logger.info("Starting server.")
     while True:
         line = sys.stdin.readline()
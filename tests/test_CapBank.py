@@ -0,0 +1,157 @@
+"""
+Tests of the export of transactions of the CapBank converter.
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from weboob.capabilities.bank import Account, Transaction
+
+from cozyweboob.capabilities import CapBank
+from cozyweboob.tools.columnar import from_columns
+
+
+class FakeBrowser(object):
+    BASEURL = None
+
+
+class FakeBank(object):
+    """
+    Fake CapBank backend, with transactions by account id. Accounts without
+    transactions do not support history.
+    """
+    name = "fakebank"
+    browser = FakeBrowser()
+
+    def __init__(self, transactions, failing_coming=False):
+        """
+        Args:
+            transactions: A dict of lists of (date, label) tuples, newest
+                first, by account id, or None for accounts without history.
+            failing_coming: Whether iter_coming should crash.
+        """
+        self.transactions = transactions
+        self.failing_coming = failing_coming
+
+    def iter_accounts(self):
+        for account_id in sorted(self.transactions):
+            account = Account()
+            account.id = account_id
+            yield account
+
+    def iter_history(self, account):
+        if self.transactions[account.id] is None:
+            raise NotImplementedError()
+        for date, label in self.transactions[account.id]:
+            transaction = Transaction()
+            transaction.date = date
+            transaction.amount = Decimal("-1.00")
+            transaction.raw = transaction.label = label
+            yield transaction
+
+    def iter_coming(self, account):
+        if self.failing_coming:
+            raise RuntimeError("Website crashed.")
+        return iter([])
+
+
+def labels(result):
+    """
+    Get the labels of the exported transactions, by account id.
+    """
+    return {
+        account_id: (
+            None if transactions is None
+            else [transaction["label"] for transaction in transactions]
+        )
+        for account_id, transactions in result["history"].items()
+    }
+
+
+def incremental(cursors):
+    """
+    Get the actions to fetch the history from the given cursors.
+    """
+    return {"fetch": True, "download": False, "cursors": cursors}
+
+
+class IncrementalHistoryTest(unittest.TestCase):
+    def test_only_new_transactions(self):
+        day = datetime.date(2026, 10, 1)
+        old = [(day, "t1"), (day - datetime.timedelta(days=30), "t0")]
+        result = CapBank.to_cozy(FakeBank({"A": old}))
+        self.assertEqual(labels(result), {"A": ["t1", "t0"]})
+        new = [(day + datetime.timedelta(days=1), "t2")] + old
+        result = CapBank.to_cozy(FakeBank({"A": new}),
+                                 incremental(result["cursors"]))
+        self.assertEqual(labels(result), {"A": ["t2"]})
+        result = CapBank.to_cozy(FakeBank({"A": new}),
+                                 incremental(result["cursors"]))
+        self.assertEqual(labels(result), {"A": []})
+        # Without cursors, the full history is returned
+        result = CapBank.to_cozy(FakeBank({"A": new}))
+        self.assertEqual(labels(result), {"A": ["t2", "t1", "t0"]})
+
+    def test_account_without_history(self):
+        day = datetime.date(2026, 10, 1)
+        bank = FakeBank({"A": [(day, "t1")], "B": None})
+        result = CapBank.to_cozy(bank)
+        self.assertEqual(labels(result), {"A": ["t1"], "B": None})
+        result = CapBank.to_cozy(bank, incremental(result["cursors"]))
+        self.assertEqual(labels(result), {"A": [], "B": None})
+
+    def test_lost_results_keep_transactions(self):
+        day = datetime.date(2026, 10, 1)
+        old = [(day, "t1")]
+        cursors = CapBank.to_cozy(FakeBank({"A": old}))["cursors"]
+        new = [(day + datetime.timedelta(days=1), "t2")] + old
+        with self.assertRaises(RuntimeError):
+            CapBank.to_cozy(FakeBank({"A": new}, failing_coming=True),
+                            incremental(cursors))
+        # Results of this run are not received by the client either
+        CapBank.to_cozy(FakeBank({"A": new}), incremental(cursors))
+        # Until the client passes the new cursors, transactions are returned
+        result = CapBank.to_cozy(FakeBank({"A": new}), incremental(cursors))
+        self.assertEqual(labels(result), {"A": ["t2"]})
+
+
+class FormatTest(unittest.TestCase):
+    def test_columns(self):
+        day = datetime.date(2026, 10, 1)
+        bank = FakeBank({"A": [(day, "t1"), (day, "t0")], "B": None})
+        result = CapBank.to_cozy(bank, {"fetch": True, "download": False,
+                                        "format": "columns",
+                                        "batch_size": 1})
+        self.assertEqual(result["history"]["A"]["format"], "columns")
+        self.assertEqual(
+            [row["label"] for row in from_columns(result["history"]["A"])],
+            ["t1", "t0"]
+        )
+        self.assertIsNone(result["history"]["B"])
+        self.assertEqual(result["coming"]["A"]["count"], 0)
+
+    def test_columns_with_spill(self):
+        day = datetime.date(2026, 10, 1)
+        bank = FakeBank({"A": [(day, "t1"), (day, "t0")], "B": [(day, "t2")]})
+        result = CapBank.to_cozy(bank, {"fetch": True, "download": False,
+                                        "format": "columns", "spill": 1})
+        try:
+            # Large lists are spilled, small ones are column-oriented
+            self.assertEqual(result["history"]["A"]["count"], 2)
+            self.assertIn("cursor", result["history"]["A"])
+            self.assertEqual(
+                [row["label"] for row in from_columns(result["history"]["B"])],
+                ["t2"]
+            )
+        finally:
+            spill_file = os.path.join(tempfile.gettempdir(),
+                                      result["history"]["A"]["cursor"])
+            shutil.rmtree(os.path.dirname(spill_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python2
+"""
+Worker node daemon, running konnectors dispatched through a work queue
+"""
+import logging
+import os
+import sys
+
+from cozyweboob import main_fetch
+from cozyweboob import WeboobProxy
+from cozyweboob import WorkerNode
+from cozyweboob import WorkerPool
+from cozyweboob.tools.env import get_int_env, is_in_debug_mode
+
+# Module specific logger
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """
+    Main function
+    """
+    # Debug only: Set logging level and format
+    if is_in_debug_mode():
+        logging.basicConfig(
+            format='%(levelname)s: %(message)s',
+            level=logging.INFO
+        )
+    else:
+        logging.basicConfig(
+            format='%(levelname)s: %(message)s',
+            level=logging.ERROR
+        )
+    if not os.environ.get("COZYWEBOOB_QUEUE"):
+        sys.exit("COZYWEBOOB_QUEUE should be set to the work queue URL.")
+    # Ensure all modules are installed and up to date before starting the
+    # worker node
+    logger.info("Ensuring all modules are installed and up to date.")
+    proxy = WeboobProxy()
+    proxy.install_modules()
+    # Start the worker processes pool, if enabled
+    fetcher = main_fetch
+    concurrency = 1
+    if get_int_env("COZYWEBOOB_WORKERS", 0) > 0:
+        logger.info("Starting worker processes.")
+        pool = WorkerPool()
+        fetcher = pool.main_fetch
+        concurrency = pool.size
+    node = WorkerNode(fetcher=fetcher, concurrency=concurrency)
+    logger.info("Starting worker node %s.", node.name)
+    try:
+        node.run_forever()
+    except KeyboardInterrupt:
+        node.stop()
+
+
+if __name__ == "__main__":
+    main()